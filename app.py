@@ -1,93 +1,134 @@
+import os
 import streamlit as st
 
 st.set_page_config(page_title="Task Management System", layout="wide")
 
 from supabase import create_client, Client
 from streamlit_cookies_manager import EncryptedCookieManager
-from modules.database import check_all_deadlines, get_db
+from modules.database import get_db, get_notifications
+from modules.index_sync import start_index_sync
+from modules.shared_cache import get_shared_cache
 from modules.manager import render_manager_dashboard
 from modules.employee import render_employee_dashboard
+from modules.instrumentation import start_request, finish_request
+from modules.auth import cookie_password, issue_token, resolve_session, login
+from modules.utils import user_tz
 
-cookies = EncryptedCookieManager(prefix="task_app", password="secret_key_123")
+try:
+    password = cookie_password()
+except ValueError as e:
+    # sessions can't be signed, refuse to serve rather than fall back to a guessable key
+    st.error(f"Configuration error: {e}. See .streamlit/secrets.toml.example.")
+    st.stop()
+cookies = EncryptedCookieManager(prefix="task_app", password=password)
 if not cookies.ready():
     st.stop()
 
-supabase = get_db()
-
-check_all_deadlines(supabase)
+trace = start_request("streamlit")
+# st.rerun() and st.stop() end the script by raising, the trace still has to be recorded
+try:
+    supabase = get_db()
 
-if 'checked' not in st.session_state:
-    check_all_deadlines(supabase)
-    st.session_state['checked'] = True
+    # deadline sweeps run on the background sync thread, never inside a page render
+    start_index_sync(supabase, sweep=True)
 
-if 'user' not in st.session_state and cookies.get('user'):
-    uid = cookies['user']
-    res = supabase.table('users').select("*").eq('id', uid).execute()
-    if res.data:
-        st.session_state['user'] = res.data[0]
+    if 'user' not in st.session_state and cookies.get('session'):
+        session_user, refreshed = resolve_session(supabase, cookies['session'])
+        if session_user:
+            st.session_state['user'] = session_user
+            if refreshed:
+                cookies['session'] = refreshed
+                cookies.save()
+        else:
+            cookies['session'] = ""
+            cookies.save()
 
-if 'user' not in st.session_state:
-    st.title(" Login / Signup")
-    mode = st.radio("", ["Login", "Sign Up"], horizontal=True)
+    if 'user' not in st.session_state:
+        st.title(" Login / Signup")
+        mode = st.radio("", ["Login", "Sign Up"], horizontal=True)
     
-    if mode == "Sign Up":
-        name = st.text_input("Full Name")
-        email = st.text_input("Email")
-        role = st.selectbox("Role", ["manager", "employee"])
-        if st.button("Register"):
-            try:
-                supabase.table('users').insert({
-                    'email': email,
-                    'full_name': name,
-                    'role': role
-                }).execute()
-                st.success("✅ Registered! Switch to Login.")
-            except Exception as e:
-                st.error(f"Error: {str(e)}")
-    else:
-        email = st.text_input("Email")
-        if st.button("Login"):
-            resp = supabase.table('users').select("*").eq('email', email).execute()
-            if resp.data:
-                st.session_state['user'] = resp.data[0]
-                cookies['user'] = str(resp.data[0]['id'])
-                cookies.save()
-                st.rerun()
-            else:
-                st.error("User not found")
+        if mode == "Sign Up":
+            name = st.text_input("Full Name")
+            email = st.text_input("Email")
+            role = st.selectbox("Role", ["manager", "employee"])
+            if st.button("Register"):
+                try:
+                    supabase.table('users').insert({
+                        'email': email.strip(),
+                        'full_name': name,
+                        'role': role
+                    }).execute()
+                    get_shared_cache().delete('employees')
+                    st.success("✅ Registered! Switch to Login.")
+                except Exception as e:
+                    st.error(f"Error: {str(e)}")
+        else:
+            email = st.text_input("Email")
+            if st.button("Login"):
+                found = login(supabase, email)
+                if found:
+                    st.session_state['user'] = found
+                    cookies['session'] = issue_token(found)
+                    cookies.save()
+                    st.rerun()
+                else:
+                    st.error("User not found")
 
-else:
-    user = st.session_state['user']
+    else:
+        user = st.session_state['user']
+        tz = user_tz(user)
     
-    with st.sidebar:
-        st.write(f"**{user['full_name']}** ({user['role']})")
+        with st.sidebar:
+            st.write(f"**{user['full_name']}** ({user['role']})")
 
-        if st.button("Logout"):
-            cookies['user'] = ""
-            cookies.save()
-            if 'user' in st.session_state:
-                del st.session_state['user']
-            st.rerun()
+            if st.button("Logout"):
+                cookies['session'] = ""
+                cookies.save()
+                if 'user' in st.session_state:
+                    del st.session_state['user']
+                st.rerun()
 
         
-        st.divider()
-        st.subheader("🔔 Notifications")
+            st.divider()
+            st.subheader("🔔 Notifications")
         
-        msgs_resp = supabase.table('messages').select("*").eq('recipient_id', user['id']).order('created_at', desc=True).execute()
-        msgs = msgs_resp.data or []
+            msgs = get_notifications(supabase, user['id'], limit=5)
         
-        if msgs:
-            for m in msgs[:5]:
-                if m['message_type'] == 'warning':
-                    st.warning(m['content'], icon="⏰")
-                elif m['message_type'] == 'completion':
-                    st.success(m['content'], icon="✅")
-                else:
-                    st.info(m['content'], icon="ℹ️")
-        else:
-            st.info("No notifications")
+            if msgs:
+                for m in msgs:
+                    if m['message_type'] == 'warning':
+                        st.warning(m['content'], icon="⏰")
+                    elif m['message_type'] == 'completion':
+                        st.success(m['content'], icon="✅")
+                    else:
+                        st.info(m['content'], icon="ℹ️")
+            else:
+                st.info("No notifications")
     
-    if user['role'] == 'manager':
-        render_manager_dashboard(supabase, user['id'])
-    else:
-        render_employee_dashboard(supabase, user['id'], user['full_name'])
+        if user['role'] == 'manager':
+            render_manager_dashboard(supabase, user['id'], tz)
+        else:
+            render_employee_dashboard(supabase, user['id'], user['full_name'], tz)
+finally:
+    finish_request(trace)
+
+if os.getenv("DEBUG_METRICS") == "1" or st.query_params.get("debug") == "1":
+    with st.sidebar:
+        st.divider()
+        st.subheader("🛠 Debug")
+        st.caption(f"{trace.query_count()} queries · {trace.elapsed() * 1000:.0f} ms this run")
+        if trace.spans:
+            st.dataframe([
+                {
+                    'kind': s.kind,
+                    'target': s.name,
+                    'op': s.op,
+                    'filters': s.detail,
+                    'rows': s.rows,
+                    'KB': round(s.bytes / 1024, 1),
+                    'ms': round(s.seconds * 1000, 1),
+                }
+                for s in trace.spans
+            ], hide_index=True)
+        for (table, op, shape), n in trace.repeated_queries():
+            st.warning(f"{n}× {op} on {table} [{shape}] — possible N+1")
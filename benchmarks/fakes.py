@@ -0,0 +1,265 @@
+import copy
+import json
+import re
+from datetime import datetime, timezone
+from functools import lru_cache
+
+# in-memory stand-in for the supabase client, only covers the query builder calls the app makes
+
+@lru_cache(maxsize=None)
+def _parse_str(value):
+    try:
+        return datetime.fromisoformat(value).astimezone(timezone.utc).timestamp()
+    except ValueError:
+        return value
+
+def _sort_key(value):
+    return _parse_str(value) if isinstance(value, str) else value
+
+def _like_to_regex(pattern):
+    parts = [re.escape(p) for p in pattern.split('%')]
+    return re.compile('^' + '.*'.join(parts) + '$', re.IGNORECASE | re.DOTALL)
+
+_OPS = {
+    'eq': lambda a, b: a == b,
+    'gt': lambda a, b: a > b,
+    'gte': lambda a, b: a >= b,
+    'lt': lambda a, b: a < b,
+    'lte': lambda a, b: a <= b,
+}
+
+def _split_top_level(text):
+    parts, depth, current = [], 0, ''
+    for ch in text:
+        if ch == ',' and depth == 0:
+            parts.append(current)
+            current = ''
+            continue
+        depth += (ch == '(') - (ch == ')')
+        current += ch
+    return parts + [current] if current else parts
+
+def _parse_or_term(term):
+    if term.startswith('and(') and term.endswith(')'):
+        tests = [_parse_or_term(t) for t in _split_top_level(term[4:-1])]
+        return lambda row: all(t(row) for t in tests)
+    column, op, value = term.split('.', 2)
+    value = value.strip('"')
+    def test(row):
+        v = row.get(column)
+        if v is None:
+            return False
+        return _OPS[op](_sort_key(v), _sort_key(type(v)(value) if not isinstance(v, str) else value))
+    return test
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.action = 'select'
+        self.columns = '*'
+        self.payload = None
+        self.filters = []
+        self.row_ids = None
+        self.orders = []
+        self.offset = 0
+        self.max_rows = None
+        self.negate = False
+
+    def select(self, columns="*", count=None):
+        self.action = 'select'
+        self.columns = columns
+        return self
+
+    def insert(self, data):
+        self.action = 'insert'
+        self.payload = data
+        return self
+
+    def update(self, data):
+        self.action = 'update'
+        self.payload = data
+        return self
+
+    def delete(self):
+        self.action = 'delete'
+        return self
+
+    @property
+    def not_(self):
+        self.negate = True
+        return self
+
+    def _filter(self, column, test):
+        if self.negate:
+            self.negate = False
+            test = (lambda t: lambda v: not t(v))(test)
+        self.filters.append((column, test))
+        return self
+
+    def eq(self, column, value):
+        if column == 'id':
+            self.row_ids = [value]
+        return self._filter(column, lambda v: v == value)
+
+    def neq(self, column, value):
+        return self._filter(column, lambda v: v != value)
+
+    def gt(self, column, value):
+        return self._filter(column, lambda v: v is not None and _sort_key(v) > _sort_key(value))
+
+    def gte(self, column, value):
+        return self._filter(column, lambda v: v is not None and _sort_key(v) >= _sort_key(value))
+
+    def lt(self, column, value):
+        return self._filter(column, lambda v: v is not None and _sort_key(v) < _sort_key(value))
+
+    def lte(self, column, value):
+        return self._filter(column, lambda v: v is not None and _sort_key(v) <= _sort_key(value))
+
+    def in_(self, column, values):
+        values = set(values)
+        if column == 'id':
+            self.row_ids = values
+        return self._filter(column, lambda v: v in values)
+
+    def is_(self, column, value):
+        target = {None: None, 'null': None, 'true': True, 'false': False}.get(value, value)
+        return self._filter(column, lambda v: v is target)
+
+    def contains(self, column, values):
+        values = set(values)
+        return self._filter(column, lambda v: values <= set(v or []))
+
+    def or_(self, filters):
+        # only the flat "col.op.value" / "and(...)" shape used for keyset cursors
+        tests = [_parse_or_term(term) for term in _split_top_level(filters)]
+        self.filters.append((None, lambda row: any(t(row) for t in tests)))
+        return self
+
+    def ilike(self, column, pattern):
+        regex = _like_to_regex(pattern)
+        return self._filter(column, lambda v: v is not None and bool(regex.match(str(v))))
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, size):
+        self.max_rows = size
+        return self
+
+    def range(self, start, end):
+        self.offset = start
+        self.max_rows = end - start + 1
+        return self
+
+    def _matches(self, row):
+        return all(test(row) if column is None else test(row.get(column)) for column, test in self.filters)
+
+    def _project(self, row):
+        if self.columns.strip() == '*':
+            return dict(row)
+        cols = [c.strip() for c in self.columns.split(',') if c.strip()]
+        return {c: row.get(c) for c in cols}
+
+    def execute(self):
+        rows = self.db.tables.setdefault(self.table, [])
+        if self.row_ids is not None:
+            # primary key lookups hit the id index instead of scanning, like postgres would
+            index = self.db.id_index(self.table)
+            rows = [index[i] for i in self.row_ids if i in index]
+        self.db.query_count += 1
+
+        if self.action == 'insert':
+            items = self.payload if isinstance(self.payload, list) else [self.payload]
+            data = [self.db.add_row(self.table, item) for item in items]
+        elif self.action == 'update':
+            data = []
+            for row in rows:
+                if self._matches(row):
+                    row.update(self.payload)
+                    data.append(dict(row))
+        elif self.action == 'delete':
+            data = [dict(r) for r in rows if self._matches(r)]
+            deleted = {r['id'] for r in data}
+            self.db.tables[self.table] = [r for r in self.db.tables[self.table] if r.get('id') not in deleted]
+            self.db.indexes.pop(self.table, None)
+        else:
+            matched = [r for r in rows if self._matches(r)]
+            for column, desc in reversed(self.orders):
+                matched.sort(key=lambda r: (r.get(column) is None, _sort_key(r.get(column))), reverse=desc)
+            if self.max_rows is not None:
+                matched = matched[self.offset:self.offset + self.max_rows]
+            elif self.offset:
+                matched = matched[self.offset:]
+            data = [self._project(r) for r in matched]
+
+        self.db.bytes_read += len(json.dumps(data, default=str))
+        return FakeResponse(data)
+
+class FakeSupabase:
+    DEFAULTS = {
+        'tasks': {'status': 'pending', 'progress': 0, 'warning_sent': False, 'escalations_sent': [], 'description': None},
+    }
+
+    def __init__(self, tables=None):
+        self.tables = tables or {}
+        self.query_count = 0
+        self.bytes_read = 0
+        self._next_id = {}
+        self.indexes = {}
+
+    def id_index(self, table):
+        if table not in self.indexes:
+            self.indexes[table] = {r['id']: r for r in self.tables.get(table, [])}
+        return self.indexes[table]
+
+    def add_row(self, table, item):
+        row = dict(self.DEFAULTS.get(table, {}))
+        row.update(item)
+        if 'id' not in row:
+            next_id = self._next_id.get(table) or max((r['id'] for r in self.tables.get(table, [])), default=0) + 1
+            row['id'] = next_id
+            self._next_id[table] = next_id + 1
+        row.setdefault('created_at', datetime.now(timezone.utc).isoformat())
+        self.tables.setdefault(table, []).append(row)
+        if table in self.indexes:
+            self.indexes[table][row['id']] = row
+        return dict(row)
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def snapshot(self):
+        return copy.deepcopy(self.tables)
+
+    def restore(self, tables):
+        self.tables = copy.deepcopy(tables)
+        self._next_id = {}
+        self.indexes = {}
+
+    def reset_counters(self):
+        self.query_count = 0
+        self.bytes_read = 0
+
+def fake_llm_task_text(prompt, user_key=None):
+    return (
+        "title=Prepare dispatch report\n"
+        "description=Prepare the weekly dispatch report\n"
+        "deadline=2026-12-12T17:00:00\n"
+        "employee_name=employee 1\n"
+    )
+
+class FakeRequest:
+    def __init__(self, payload):
+        self.payload = payload
+        self.headers = {}
+
+    async def json(self):
+        return self.payload
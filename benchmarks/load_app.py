@@ -0,0 +1,29 @@
+import os
+import time
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+from benchmarks.fakes import FakeSupabase, fake_llm_task_text
+from benchmarks.orgs import generate_org
+
+import modules.database as database
+
+# the webhook app wired to an in-memory org and a stub LLM, served by benchmarks/load_test.py
+
+database._supabase = FakeSupabase(generate_org(int(os.getenv("LOAD_TEST_TASKS", "1000"))))
+
+import main
+
+LLM_LATENCY = float(os.getenv("LOAD_TEST_LLM_MS", "50")) / 1000
+
+def slow_llm(prompt, user_key=None):
+    # blocking, like the real gemini client, so one worker handles one webhook at a time
+    time.sleep(LLM_LATENCY)
+    return fake_llm_task_text(prompt)
+
+main.gen_ai_response = slow_llm
+main.send_telegram_message = lambda chat_id, text: True
+main.RUN_DEADLINE_SWEEP = False
+
+app = main.app
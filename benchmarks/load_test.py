@@ -0,0 +1,105 @@
+"""
+Load test the webhook across uvicorn worker counts.
+
+    python -m benchmarks.load_test --workers 1,2,4 --requests 400
+
+Each worker count gets its own uvicorn process group and shared cache file.
+Reports throughput, latency percentiles and scaling efficiency against one worker.
+"""
+import argparse
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.run import percentile
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_ready(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server at {url} did not come up")
+
+def run_load(workers, n_requests, concurrency, llm_ms):
+    port = free_port()
+    cache_dir = tempfile.mkdtemp(prefix="task_app_load_")
+    env = dict(os.environ,
+               SHARED_CACHE_PATH=os.path.join(cache_dir, "cache.sqlite3"),
+               LOAD_TEST_LLM_MS=str(llm_ms),
+               LLM_RATE_PER_MIN="1000000", LLM_BURST="1000000",
+               LLM_USER_RATE_PER_MIN="1000000", LLM_USER_BURST="1000000")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.load_app:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(base + "/")
+        ids = itertools.count(1)
+
+        def hit(_):
+            update_id = next(ids)
+            payload = {"update_id": update_id, "message": {"text": "Assign employee 1 the dispatch report",
+                                                           "from": {"id": update_id % 50, "first_name": "Load"}}}
+            start = time.perf_counter()
+            r = requests.post(base + "/telegram-webhook", json=payload, timeout=60)
+            r.raise_for_status()
+            return (time.perf_counter() - start) * 1000
+
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(hit, range(min(concurrency, n_requests))))  # warm up every worker
+            start = time.perf_counter()
+            latencies = list(pool.map(hit, range(n_requests)))
+            elapsed = time.perf_counter() - start
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+    return {
+        'rps': n_requests / elapsed,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Webhook throughput across uvicorn worker counts")
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--llm-ms", type=float, default=50)
+    parser.add_argument("--min-efficiency", type=float, default=0.0, help="fail below this fraction of linear scaling")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for workers in [int(w) for w in args.workers.split(",") if w]:
+        results[workers] = run_load(workers, args.requests, args.concurrency, args.llm_ms)
+
+    base_workers = min(results)
+    base_rps = results[base_workers]['rps'] / base_workers
+    print(f"{'workers':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'speedup':>10}{'efficiency':>12}")
+    failed = False
+    for workers, r in results.items():
+        speedup = r['rps'] / results[base_workers]['rps']
+        efficiency = r['rps'] / (base_rps * workers)
+        failed |= efficiency < args.min_efficiency
+        print(f"{workers:>8}{r['rps']:>10.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{speedup:>10.2f}{efficiency:>12.0%}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
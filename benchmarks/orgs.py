@@ -0,0 +1,61 @@
+import random
+from datetime import timedelta
+from modules.utils import get_ist_now
+
+# synthetic org generator, sizes are driven by the task count
+
+TASK_WORDS = ['Prepare', 'Review', 'Dispatch', 'Audit', 'Update', 'Inspect', 'Plan', 'Close']
+TASK_OBJECTS = ['invoice batch', 'moulding report', 'stock sheet', 'vendor list', 'QC checklist', 'shift roster']
+
+def generate_org(n_tasks, seed=7, tasks_per_employee=25, employees_per_manager=10, messages_per_user=20):
+    rng = random.Random(seed)
+    now = get_ist_now()
+
+    n_employees = max(1, n_tasks // tasks_per_employee)
+    n_managers = max(1, n_employees // employees_per_manager)
+
+    users = []
+    for i in range(n_managers):
+        users.append({'id': i + 1, 'email': f'manager{i + 1}@example.com', 'full_name': f'Manager {i + 1}', 'role': 'manager'})
+    for i in range(n_employees):
+        users.append({'id': n_managers + i + 1, 'email': f'employee{i + 1}@example.com', 'full_name': f'Employee {i + 1}', 'role': 'employee'})
+
+    managers = [u['id'] for u in users if u['role'] == 'manager']
+    employees = [u['id'] for u in users if u['role'] == 'employee']
+
+    tasks = []
+    for i in range(n_tasks):
+        emp_id = employees[i % len(employees)]
+        manager_id = managers[(emp_id - n_managers - 1) // employees_per_manager % len(managers)]
+        created = now - timedelta(days=rng.uniform(0, 60))
+        # most tasks are due within a couple of weeks, a tail is overdue or far out
+        offset_hours = rng.choice([rng.uniform(-72, 0), rng.uniform(0, 72), rng.uniform(0, 336), rng.uniform(336, 1440)])
+        due = now + timedelta(hours=offset_hours)
+        completed = rng.random() < 0.55
+        tasks.append({
+            'id': i + 1,
+            'title': f"{rng.choice(TASK_WORDS)} {rng.choice(TASK_OBJECTS)} #{i + 1}",
+            'description': ' '.join(rng.choice(TASK_OBJECTS) for _ in range(rng.randint(20, 120))),
+            'assigned_to': emp_id,
+            'assigned_by': manager_id,
+            'status': 'completed' if completed else 'pending',
+            'progress': 100 if completed else rng.choice([0, 10, 25, 50, 75, 90]),
+            'due_date': due.isoformat() if rng.random() > 0.03 else None,
+            'created_at': created.isoformat(),
+            'warning_sent': False,
+            'escalations_sent': [],
+        })
+
+    messages = []
+    msg_types = ['new_task', 'warning', 'completion', 'task_edited']
+    for user in users:
+        for j in range(messages_per_user):
+            messages.append({
+                'id': len(messages) + 1,
+                'recipient_id': user['id'],
+                'content': f"Notification {j + 1} for {user['full_name']}",
+                'message_type': rng.choice(msg_types),
+                'created_at': (now - timedelta(minutes=rng.randint(0, 60 * 24 * 30))).isoformat(),
+            })
+
+    return {'users': users, 'tasks': tasks, 'messages': messages}
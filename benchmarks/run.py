@@ -0,0 +1,184 @@
+"""
+Benchmark the hot paths against a synthetic org.
+
+    python -m benchmarks.run --sizes 10,1000 --check benchmarks/thresholds.json
+
+Every scenario runs against FakeSupabase with a stub LLM, so nothing leaves the machine.
+Reports p50/p95/max latency, queries per call, bytes read per call and peak traced memory.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+# measure the cold path, not whatever an earlier size left in the shared cache
+os.environ.setdefault("EMPLOYEE_CACHE_TTL", "0")
+BENCH_DIR = tempfile.mkdtemp(prefix="task_bench_")
+os.environ.setdefault("SEARCH_INDEX_PATH", os.path.join(BENCH_DIR, "search.sqlite3"))
+os.environ.setdefault("WORKLOAD_PATH", os.path.join(BENCH_DIR, "workload.sqlite3"))
+
+from benchmarks.fakes import FakeSupabase, FakeRequest, fake_llm_task_text
+from benchmarks.orgs import generate_org
+
+import modules.database as database
+import modules.search as search
+import modules.workload as workload
+
+logging.getLogger("modules").setLevel(logging.WARNING)
+
+DEFAULT_THRESHOLDS = os.path.join(os.path.dirname(__file__), "thresholds.json")
+
+def load_app(db):
+    # streamlit runs in bare mode here and warns on every call without a script context,
+    # parse .streamlit/config.toml first so its logger.level doesn't win later
+    from streamlit import config
+    from streamlit.logger import set_log_level
+    config.get_config_options()
+    set_log_level("error")
+
+    # everything that calls get_db() after this point sees the fake client
+    database._supabase = db
+    import main
+    from modules.manager import render_manager_dashboard
+    from modules.employee import render_employee_dashboard
+
+    main.supabase = db
+    main.gen_ai_response = fake_llm_task_text
+    main.send_telegram_message = lambda chat_id, text: True
+
+    return {
+        'main': main,
+        'render_manager_dashboard': render_manager_dashboard,
+        'render_employee_dashboard': render_employee_dashboard,
+    }
+
+def build_scenarios(app, org):
+    manager = next(u for u in org['users'] if u['role'] == 'manager')
+    employee = next(u for u in org['users'] if u['role'] == 'employee')
+    update = {'message': {'text': 'Assign employee 1 to prepare the dispatch report by friday', 'from': {'id': 1, 'first_name': 'Bench'}}}
+
+    # (name, callable taking the db, mutates data)
+    return [
+        ('render_manager_dashboard', lambda db: app['render_manager_dashboard'](db, manager['id']), False),
+        ('render_employee_dashboard', lambda db: app['render_employee_dashboard'](db, employee['id'], employee['full_name']), False),
+        ('check_all_deadlines', lambda db: database.check_all_deadlines(db), True),
+        ('get_employee_stats', lambda db: database.get_employee_stats(db, employee['id']), False),
+        ('telegram_webhook', lambda db: asyncio.run(app['main'].telegram_webhook(FakeRequest(update))), True),
+    ]
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+def run_scenario(db, baseline, fn, mutates, repeat):
+    timings = []
+    queries = []
+    bytes_read = []
+    for _ in range(repeat):
+        if mutates:
+            db.restore(baseline)
+        db.reset_counters()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn(db)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(db.query_count)
+        bytes_read.append(db.bytes_read)
+
+    # separate pass, tracemalloc slows everything down too much to time with it on
+    if mutates:
+        db.restore(baseline)
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn(db)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'max_ms': round(max(timings), 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'queries': max(queries),
+        'kb_read': round(max(bytes_read) / 1024, 1),
+        'peak_mb': round(peak / (1024 * 1024), 2),
+    }
+
+def check_thresholds(results, thresholds):
+    failures = []
+    for scenario, by_size in results.items():
+        for size, metrics in by_size.items():
+            limits = thresholds.get(scenario, {}).get(str(size), {})
+            for metric, limit in limits.items():
+                if metric in metrics and metrics[metric] > limit:
+                    failures.append(f"{scenario} @ {size} tasks: {metric}={metrics[metric]} > {limit}")
+    return failures
+
+def print_report(results):
+    header = f"{'scenario':<28}{'tasks':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'queries':>9}{'KB read':>11}{'peak MB':>9}"
+    print(header)
+    print('-' * len(header))
+    for scenario, by_size in results.items():
+        for size, m in by_size.items():
+            print(f"{scenario:<28}{size:>8}{m['p50_ms']:>10}{m['p95_ms']:>10}{m['max_ms']:>10}{m['queries']:>9}{m['kb_read']:>11}{m['peak_mb']:>9}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark dashboard, deadline and webhook hot paths")
+    parser.add_argument("--sizes", default="10,1000", help="comma separated task counts, e.g. 10,1000,100000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", default="", help="comma separated scenario names")
+    parser.add_argument("--json", default="", help="write results to this file")
+    parser.add_argument("--check", nargs="?", const=DEFAULT_THRESHOLDS, default="", help="fail when a threshold file is exceeded")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    only = {s for s in args.only.split(",") if s}
+
+    db = FakeSupabase()
+    app = load_app(db)
+    results = {}
+
+    for size in sizes:
+        org = generate_org(size)
+        db.restore(org)
+        baseline = db.snapshot()
+        # the index and counters are kept up on writes in production, here they are built once per org outside the timings
+        search.rebuild_index(db)
+        workload.rebuild_workload(db)
+        db.reset_counters()
+        for name, fn, mutates in build_scenarios(app, org):
+            if only and name not in only:
+                continue
+            results.setdefault(name, {})[size] = run_scenario(db, baseline, fn, mutates, args.repeat)
+        db.restore(baseline)
+
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.check:
+        with open(args.check) as f:
+            failures = check_thresholds(results, json.load(f))
+        if failures:
+            print("\nRegressions:")
+            for line in failures:
+                print(f"  {line}")
+            return 1
+        print("\nAll thresholds met.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
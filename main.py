@@ -1,18 +1,26 @@
 from fastapi import FastAPI, Request
+import asyncio
+from fastapi.responses import PlainTextResponse, StreamingResponse, JSONResponse
 import os
-from datetime import datetime
+import hmac
+from datetime import datetime, date
+from typing import Optional
 import requests
 import google.generativeai as genai
 from dotenv import load_dotenv
+from modules.instrumentation import REGISTRY, start_request, finish_request, traced
+from modules.ratelimit import LLM_GATE, LLMUnavailable
+from modules.export import export_stream
+from modules.database import get_db, get_employees, create_task, send_notification
+from modules.escalation import run_scheduled_sweep, SWEEP_INTERVAL
+from modules.shared_cache import get_shared_cache
+from modules.workload import suggest_assignees, describe_capacity, workload_ready
+from modules.index_sync import start_index_sync
 load_dotenv()
 
 
-try:
-    from modules.database import get_db, create_task, send_notification
-    supabase = get_db()
-except Exception as e:
-    print(f"Warning: Could not load database: {e}")
-    supabase = None
+# built per worker on startup, see init_worker
+supabase = None
 
 app = FastAPI()
 
@@ -20,15 +28,88 @@ MANAGER_TELEGRAM_ID = 5035988742
 MANAGER_USER_ID = os.getenv("MANAGER_USER_ID")
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 GEMINI_API_KEY_FLASH = os.getenv("GEMINI_API_KEY_FLASH")
+WEBHOOK_LLM_MAX_WAIT = float(os.getenv("WEBHOOK_LLM_MAX_WAIT", "2"))
+EXPORT_API_TOKEN = os.getenv("EXPORT_API_TOKEN")
+RUN_DEADLINE_SWEEP = os.getenv("RUN_DEADLINE_SWEEP", "1") == "1"
+TELEGRAM_DEDUP_TTL = 24 * 3600
+WEBHOOK_RETRY_ATTEMPTS = int(os.getenv("WEBHOOK_RETRY_ATTEMPTS", "3"))
+# metrics label for requests that matched no route
+UNMATCHED_ROUTE = "<unmatched>"
 
 genai.configure(api_key=GEMINI_API_KEY_FLASH)
 
 
+async def deadline_sweep_loop():
+    # every worker runs this loop, the shared lease lets only one of them sweep per interval
+    while True:
+        if supabase is not None:
+            try:
+                await asyncio.to_thread(run_scheduled_sweep, supabase)
+            except Exception as e:
+                print(f"❌ Deadline sweep failed: {e}")
+        await asyncio.sleep(min(60, SWEEP_INTERVAL))
+
+
+@app.on_event("startup")
+async def init_worker():
+    global supabase
+    try:
+        supabase = get_db()
+    except Exception as e:
+        print(f"Warning: Could not load database: {e}")
+        return
+    if RUN_DEADLINE_SWEEP:
+        asyncio.create_task(deadline_sweep_loop())
+    # the api only reads workload counters, the search index is kept on the streamlit host
+    start_index_sync(supabase, names=('workload',))
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    trace = start_request(UNMATCHED_ROUTE)
+    try:
+        return await call_next(request)
+    finally:
+        # label by route template, raw paths (/export/<anything>, scanners) would grow the metrics without bound
+        route = request.scope.get('route')
+        trace.name = getattr(route, 'path', UNMATCHED_ROUTE)
+        finish_request(trace)
+
+
 @app.get("/")
 async def root():
     return {"status": "ok", "message": "Jayashree Polymers Task Manager API is running"}
 
 
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/export/{dataset}")
+def export_data(dataset: str, request: Request, format: str = "csv", columns: str = "",
+                start: Optional[date] = None, end: Optional[date] = None,
+                manager_id: Optional[str] = None, recipient_id: Optional[str] = None):
+    token = request.headers.get("x-export-token", "")
+    if not EXPORT_API_TOKEN or not hmac.compare_digest(token, EXPORT_API_TOKEN):
+        return JSONResponse({"ok": False, "error": "forbidden"}, status_code=403)
+
+    try:
+        chunks, media_type, filename = export_stream(
+            supabase, dataset, format,
+            columns=[c.strip() for c in columns.split(",") if c.strip()],
+            start=start, end=end,
+            manager_id=manager_id,
+            recipient_ids=[recipient_id] if recipient_id else None,
+        )
+    except ValueError as e:
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=400)
+
+    return StreamingResponse(chunks, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@traced('outbound', 'telegram')
 def send_telegram_message(chat_id: int, text: str) -> bool:
 
     if not TELEGRAM_BOT_TOKEN:
@@ -50,17 +131,23 @@ def send_telegram_message(chat_id: int, text: str) -> bool:
         return False
 
 
-def gen_ai_response(prompt: str):
+@traced('llm', 'gemini')
+def gen_ai_response(prompt: str, user_key=None):
+    # raises LLMUnavailable without calling gemini when quota or the user's share is used up
     try:
-        model = genai.GenerativeModel('gemini-3-flash-preview')   
-        response = model.generate_content(prompt, stream=False)                
+        with LLM_GATE.call(user_key, max_wait=WEBHOOK_LLM_MAX_WAIT):
+            model = genai.GenerativeModel('gemini-3-flash-preview')   
+            response = model.generate_content(prompt, stream=False)                
+            # .text raises ValueError on blocked or empty responses
+            return response.text
+    except LLMUnavailable:
+        raise
     except Exception as e:
         return f"Error generating response: {str(e)}"
-    return response.text if hasattr(response, 'text') else str(response)
 
 
 
-def handle_task_commands(text: str) -> str:
+def handle_task_commands(text: str, user_key=None) -> str:
     print("Processing task command...")
 
     prompt = f"""
@@ -89,7 +176,7 @@ Text:
 {text}
 """
 
-    response = gen_ai_response(prompt)
+    response = gen_ai_response(prompt, user_key=user_key)
     return response
 
 
@@ -119,11 +206,88 @@ def parse_task_output(text: str) -> dict:
     }
 
 
+def workload_note(emp_id, ranked, names, limit=2):
+    # ranked is taken before the new task is counted, so the comparison is against the load at assign time
+    if not ranked:
+        return ""
+    capacity = dict(ranked)
+    note = f"\n📊 {names[emp_id]}: {describe_capacity(capacity[emp_id])}" if emp_id in capacity else ""
+    lighter = [(e, c) for e, c in ranked if e != emp_id and c['score'] > capacity.get(emp_id, {}).get('score', -1)][:limit]
+    if lighter:
+        note += "\n💡 More available: " + ", ".join(f"{names[e]} ({describe_capacity(c)})" for e, c in lighter)
+    return note
+
+
+def process_task_command(text, sender_id):
+    ai_response = handle_task_commands(f"{text}", user_key=sender_id)
+    deatails = parse_task_output(ai_response)
+    employees = get_employees(supabase)
+    names = {e['id']: e['full_name'] for e in employees}
+    emp_id = next((e['id'] for e in employees if e['full_name'].lower() == deatails['employee_name'].strip().lower()), None)
+    ranked = suggest_assignees(list(names), limit=None) if workload_ready() else []
+    create_task(
+        title=deatails['title'],
+        desc=deatails['description'],
+        emp_id=emp_id,
+        manager_id=MANAGER_USER_ID,
+        due_datetime_iso=deatails['deadline'],
+        supabase=supabase
+    )
+    send_notification(
+        supabase,
+        recipient_id=emp_id,
+        content=f"New Task Assigned: {deatails['title']} with deadline {deatails['deadline']}",
+        msg_type="new_task"
+    )
+    send_telegram_message(
+        chat_id=sender_id,
+        text=f"✅ Task {deatails['title']} assigned to {deatails['employee_name'].title()} with deadline {deatails['deadline']}."
+             + workload_note(emp_id, ranked, names)
+    )
+
+
+# queued retries live in this worker's memory, a restart drops them
+_pending_retries = set()
+
+def schedule_task_command_retry(text, sender_id, delay, attempt=1):
+    task = asyncio.get_running_loop().create_task(retry_task_command(text, sender_id, delay, attempt))
+    _pending_retries.add(task)
+    task.add_done_callback(_pending_retries.discard)
+
+
+async def retry_task_command(text, sender_id, delay, attempt):
+    await asyncio.sleep(delay)
+    try:
+        await asyncio.to_thread(process_task_command, text, sender_id)
+    except LLMUnavailable as e:
+        if attempt < WEBHOOK_RETRY_ATTEMPTS:
+            schedule_task_command_retry(text, sender_id, e.retry_after, attempt + 1)
+            return
+        print(f"⛔ Giving up on queued command from {sender_id}: {e}")
+        await asyncio.to_thread(send_telegram_message, sender_id,
+                                f"⛔ {e.reason}. Your request could not be processed, please send it again later.")
+    except Exception as e:
+        print(f"❌ Queued command from {sender_id} failed: {e}")
+        await asyncio.to_thread(send_telegram_message, sender_id, f"❌ Your queued request failed: {e}")
+
+
+def claim_update(update_id):
+    """True for the first delivery of an update on this host, False for a redelivery."""
+    return get_shared_cache().add(f"tg_update:{update_id}", 1, TELEGRAM_DEDUP_TTL)
+
+
 @app.post("/telegram-webhook")
 async def telegram_webhook(req: Request):
     print("✅ Telegram webhook HIT")
     data = await req.json()
 
+    # telegram redelivers updates it didn't get a timely 200 for, and any worker may receive the retry
+    update_id = data.get("update_id")
+    # a sqlite write that can wait on other workers' locks, keep it off the event loop
+    if update_id is not None and not await asyncio.to_thread(claim_update, update_id):
+        print(f"↩️ Duplicate update {update_id} skipped")
+        return {"ok": True, "duplicate": True}
+
     msg = data.get("message")
     if not msg or "text" not in msg:
         return {"ok": True}
@@ -135,33 +299,20 @@ async def telegram_webhook(req: Request):
     print(f"📩 Message from {sender_id} ({sender_name}): {text}")
     
     try:
-        ai_response = handle_task_commands(f"{text}")
-        deatails = parse_task_output(ai_response)
-        emp_id = supabase.table('users').select('id').ilike('full_name', deatails['employee_name']).execute().data
-        create_task(
-            title=deatails['title'],
-            desc=deatails['description'],
-            emp_id=emp_id[0]['id'] if emp_id else None,
-            manager_id=MANAGER_USER_ID,
-            due_datetime_iso=deatails['deadline'],
-            supabase=supabase
-        )
-        send_notification(
-            supabase,
-            recipient_id=emp_id[0]['id'] if emp_id else None,
-            content=f"New Task Assigned: {deatails['title']} with deadline {deatails['deadline']}",
-            msg_type="new_task"
-        )
-        send_telegram_message(
-            chat_id=sender_id,
-            text=f"✅ Task {deatails['title']} assigned to {deatails['employee_name'].title()} with deadline {deatails['deadline']}."
+        # the llm gate may sleep while waiting for a token, keep it off the event loop
+        await asyncio.to_thread(process_task_command, text, sender_id)
+    except LLMUnavailable as e:
+        print(f"⛔ LLM call rejected: {e}")
+        schedule_task_command_retry(text, sender_id, e.retry_after)
+        # replies go through requests.post, which blocks
+        await asyncio.to_thread(
+            send_telegram_message, sender_id,
+            f"⏳ {e.reason}. Your request is queued and will be retried in about {max(1, round(e.retry_after / 60))} min."
         )
+        return {"ok": True, "queued": True, "error": str(e)}
     except Exception as e:
         print(f"❌ Error parsing task: {str(e)}")
-        send_telegram_message(
-            chat_id=sender_id,
-            text=f"Quota exceeded !! Please try again later."
-        )
+        await asyncio.to_thread(send_telegram_message, sender_id, "Quota exceeded !! Please try again later.")
         return {"ok": True, "error": str(e)}
    
     if sender_id != MANAGER_TELEGRAM_ID:
@@ -0,0 +1,5 @@
+-- per-user display timezone, read into the session token at login (NULL means IST)
+alter table users add column if not exists timezone text;
+
+-- escalation tiers already sent for a task, replaces the single warning_sent flag
+alter table tasks add column if not exists escalations_sent text[] not null default '{}';
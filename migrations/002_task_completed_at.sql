@@ -0,0 +1,3 @@
+-- when a task was marked completed, the workload on-time rate compares it with due_date.
+-- existing completed tasks keep NULL and are left out of the on-time rate
+alter table tasks add column if not exists completed_at timestamptz;
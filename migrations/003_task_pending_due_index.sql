@@ -0,0 +1,2 @@
+-- the deadline sweep range-scans pending tasks by due date and pages on (due_date, id)
+create index if not exists tasks_pending_due on tasks (due_date, id) where status = 'pending';
@@ -1,20 +1,26 @@
 import streamlit as st
 import google.generativeai as genai
+from .instrumentation import traced
+from .ratelimit import LLM_GATE, LLMUnavailable
 
 
 genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
-def gen_ai_response(prompt: str):
+@traced('llm', 'gemini')
+def gen_ai_response(prompt: str, user_key=None):
     try:
-        model = genai.GenerativeModel('gemini-3-flash-preview')
-        response = model.generate_content(prompt, stream=True)
-        for chunk in response:
-            if chunk.text:
-                yield chunk.text
-                
+        with LLM_GATE.call(user_key):
+            model = genai.GenerativeModel('gemini-3-flash-preview')
+            response = model.generate_content(prompt, stream=True)
+            for chunk in response:
+                # .text raises ValueError on blocked or empty chunks, which counts as a failure
+                if chunk.text:
+                    yield chunk.text
+    except LLMUnavailable as e:
+        yield f"⏳ {e.reason}. AI analysis will be available again in about {max(1, round(e.retry_after))}s."
     except Exception as e:
         yield f"Error generating response: {str(e)}"
 
-def gen_performance_analysis(emp_name: str, stats: dict) -> str:
+def gen_performance_analysis(emp_name: str, stats: dict, user_key=None) -> str:
     prompt = f"""
 Analyze this employee's performance and provide insights:
 
@@ -33,7 +39,7 @@ Provide a brief, professional performance analysis with:
 
 Keep it concise and actionable.
     """
-    return gen_ai_response(prompt)
+    return gen_ai_response(prompt, user_key=user_key)
 
 def gen_task_summary(task_title: str, task_desc: str, progress: int) -> str:
     prompt = f"""
@@ -4,7 +4,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 import plotly.graph_objects as go
 import plotly.express as px
-from .utils import format_datetime_ist
+from .utils import format_datetimes
 
 def render_metrics(stats):
     col1, col2, col3, col4 = st.columns(4)
@@ -50,7 +50,7 @@ def render_progress_line(tasks):
 
 
 
-def render_tasks_table(tasks):
+def render_tasks_table(tasks, tz=None):
     if not tasks:
         st.info("No tasks yet")
         return
@@ -60,11 +60,10 @@ def render_tasks_table(tasks):
             'Task': t['title'][:30],
             'Status': t['status'].upper(),
             'Progress': f"{t['progress']}%",
-            'Due Date': format_datetime_ist(t['due_date']),
-
         }
         for t in tasks
     ])
+    task_df['Due Date'] = format_datetimes([t['due_date'] for t in tasks], tz)
     
     st.dataframe(task_df, hide_index=True)
 
@@ -104,7 +103,7 @@ def render_performance_gauge(completion_rate):
     fig.update_layout(height=400)
     st.plotly_chart(fig, )
 
-def render_employee_report(supabase, employee_id, employee_name):
+def render_employee_report(supabase, employee_id, employee_name, viewer_id=None):
     from .database import get_employee_stats
     from .ai_service import gen_performance_analysis
     
@@ -135,5 +134,5 @@ def render_employee_report(supabase, employee_id, employee_name):
     
     st.divider()
     st.markdown("### 🤖 AI Analysis")
-    ai_analysis = gen_performance_analysis(employee_name, stats)
+    ai_analysis = gen_performance_analysis(employee_name, stats, user_key=viewer_id)
     st.write_stream(ai_analysis)
@@ -0,0 +1,121 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from .database import get_employee_details, with_optional_columns, USER_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# signed session tokens, the cookie carries id/role/name so a new session needs no users query
+
+SESSION_TTL = int(os.getenv("SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+PROFILE_STALE_AFTER = int(os.getenv("PROFILE_STALE_SECONDS", "900"))
+PROFILE_CACHE_SIZE = 1024
+
+_profile_cache = OrderedDict()
+_profile_lock = threading.Lock()
+
+def _secret():
+    # a dedicated key, so rotating the supabase key can't forge or invalidate sessions
+    secret = os.getenv("SESSION_SECRET")
+    if not secret:
+        raise ValueError("SESSION_SECRET environment variable is required")
+    return secret.encode()
+
+def cookie_password():
+    return os.getenv("COOKIE_PASSWORD") or hashlib.sha256(b"cookie:" + _secret()).hexdigest()
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def _sign(payload):
+    return _b64encode(hmac.new(_secret(), payload.encode(), hashlib.sha256).digest())
+
+def issue_token(user, now=None):
+    now = int(now or time.time())
+    claims = {
+        'uid': user['id'],
+        'role': user['role'],
+        'name': user['full_name'],
+        'tz': user.get('timezone'),
+        'iat': now,
+        'exp': now + SESSION_TTL,
+    }
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_sign(payload)}"
+
+def verify_token(token, now=None):
+    if not token or token.count(".") != 1:
+        return None
+    payload, sig = token.split(".")
+    try:
+        valid = hmac.compare_digest(sig.encode(), _sign(payload).encode())
+    except UnicodeEncodeError:
+        valid = False
+    if not valid:
+        logger.warning("Rejected session token with bad signature")
+        return None
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if claims.get('exp', 0) < (now or time.time()):
+        return None
+    return claims
+
+def user_from_claims(claims):
+    return {'id': claims['uid'], 'role': claims['role'], 'full_name': claims['name'], 'timezone': claims.get('tz')}
+
+def get_cached_profile(supabase, user_id, now=None):
+    now = now or time.time()
+    with _profile_lock:
+        hit = _profile_cache.get(user_id)
+        if hit and now - hit[0] < PROFILE_STALE_AFTER:
+            _profile_cache.move_to_end(user_id)
+            return hit[1]
+
+    profile = get_employee_details(supabase, user_id)
+    with _profile_lock:
+        if profile:
+            _profile_cache[user_id] = (now, profile)
+            _profile_cache.move_to_end(user_id)
+            while len(_profile_cache) > PROFILE_CACHE_SIZE:
+                _profile_cache.popitem(last=False)
+        else:
+            _profile_cache.pop(user_id, None)
+    return profile
+
+def resolve_session(supabase, token, now=None):
+    """
+    Returns (user, refreshed_token). user is None when the token is invalid,
+    expired or the account no longer exists. refreshed_token is set only when
+    the profile was stale and had to be reloaded.
+    """
+    now = now or time.time()
+    claims = verify_token(token, now)
+    if not claims:
+        return None, None
+
+    if now - claims['iat'] < PROFILE_STALE_AFTER:
+        return user_from_claims(claims), None
+
+    profile = get_cached_profile(supabase, claims['uid'], now)
+    if not profile:
+        return None, None
+    return profile, issue_token(profile, now)
+
+def login(supabase, email):
+    email = (email or "").strip()
+    if not email or "@" not in email:
+        return None
+    resp = with_optional_columns('users', USER_COLUMNS['profile'],
+                                 lambda cols: supabase.table('users').select(",".join(cols)).eq('email', email).limit(1).execute())
+    return resp.data[0] if resp.data else None
@@ -2,8 +2,9 @@ import logging
 import os
 from dotenv import load_dotenv
 from supabase import create_client
-from datetime import datetime, timedelta, timezone
-from .utils import get_ist_now
+from .utils import get_ist_now, completed_on_time
+from .instrumentation import InstrumentedClient, traced
+from .shared_cache import get_shared_cache
 
 load_dotenv()
 
@@ -11,10 +12,14 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 _supabase = None
-#getting single supabse client
+_supabase_pid = None
+EMPLOYEE_CACHE_TTL = int(os.getenv("EMPLOYEE_CACHE_TTL", "60"))
+
+#getting single supabse client per worker process
 def get_db():
-    global _supabase
-    if _supabase is None:
+    global _supabase, _supabase_pid
+    # a client inherited through fork shares its connection pool with the parent, build a fresh one
+    if _supabase is None or _supabase_pid not in (None, os.getpid()):
         url = os.getenv("SUPABASE_URL")
         key = os.getenv("SUPABASE_KEY")
         
@@ -22,12 +27,61 @@ def get_db():
             raise ValueError("SUPABASE_URL and SUPABASE_KEY environment variables are required")
         
         _supabase = create_client(url, key)
+        if os.getenv("METRICS_ENABLED", "1") != "0":
+            _supabase = InstrumentedClient(_supabase)
+        _supabase_pid = os.getpid()
     return _supabase
 
+# column projections per view, hot reads should never need select("*")
+TASK_COLUMNS = {
+    'list': "id,title,status,progress,due_date,assigned_to,assigned_by",
+    'detail': "id,title,description,status,progress,due_date,assigned_to,assigned_by,created_at",
+    'stats': "id,status,progress,due_date,created_at,completed_at",
+    'sweep': "id,title,progress,due_date,assigned_to,assigned_by,warning_sent,escalations_sent",
+}
+USER_COLUMNS = {
+    'list': "id,full_name,role",
+    'profile': "id,email,full_name,role,timezone",
+}
+MESSAGE_COLUMNS = {
+    'list': "id,content,message_type,created_at",
+}
+
+# columns added by migrations/*.sql. until a migration has been run the app leaves the
+# column out of reads and writes instead of failing every query that mentions it
+OPTIONAL_COLUMNS = {
+    'users': {'timezone'},
+    'tasks': {'escalations_sent', 'completed_at'},
+}
+_missing_columns = set()
+
+def _is_missing_column_error(exc, column):
+    text = str(exc)
+    return column in text and any(m in text for m in ('42703', 'PGRST204', 'does not exist', 'Could not find'))
+
+def column_available(table, column):
+    return (table, column) not in _missing_columns
+
+def with_optional_columns(table, columns, run):
+    """
+    Calls run(columns) with the columns the schema is known to have. When the error names
+    an optional column that is missing, it is remembered and the call retried without it.
+    """
+    columns = columns.split(",") if isinstance(columns, str) else list(columns)
+    while True:
+        present = [c for c in columns if column_available(table, c)]
+        try:
+            return run(present)
+        except Exception as e:
+            missing = next((c for c in OPTIONAL_COLUMNS.get(table, ()) if c in present and _is_missing_column_error(e, c)), None)
+            if missing is None:
+                raise
+            logger.warning(f"Column {table}.{missing} is missing, run the SQL in migrations/. Continuing without it.")
+            _missing_columns.add((table, missing))
+
 def get_employee_stats(supabase, employee_id, days=15):
-    ist = timezone(timedelta(hours=5, minutes=30))
-    
-    resp = supabase.table('tasks').select("*").eq('assigned_to', employee_id).execute()
+    resp = with_optional_columns('tasks', TASK_COLUMNS['stats'], lambda cols: (
+        supabase.table('tasks').select(",".join(cols)).eq('assigned_to', employee_id).execute()))
     tasks = resp.data or []
     
     stats = {
@@ -45,26 +99,67 @@ def get_employee_stats(supabase, employee_id, days=15):
         stats['completion_rate'] = (stats['completed_tasks'] / stats['total_tasks']) * 100
         stats['avg_progress'] = sum(t['progress'] for t in tasks) / stats['total_tasks']
     
-    now = get_ist_now()
+    # rated on completed_at, completions without it are counted in neither
     for task in tasks:
-        if task['status'] == 'completed' and task['due_date']:
-            due = datetime.fromisoformat(task['due_date']).astimezone(ist)
-            if due >= now:
-                stats['on_time'] += 1
-            else:
-                stats['delayed'] += 1
+        if task['status'] == 'completed':
+            on_time = completed_on_time(task['due_date'], task.get('completed_at'))
+            if on_time is not None:
+                stats['on_time' if on_time else 'delayed'] += 1
     
     return stats
 
-def get_team_tasks(supabase, manager_id):
-    resp = supabase.table('tasks').select("*").eq('assigned_by', manager_id).execute()
+def get_team_tasks(supabase, manager_id, view='list'):
+    resp = supabase.table('tasks').select(TASK_COLUMNS[view]).eq('assigned_by', manager_id).execute()
+    return resp.data or []
+
+def get_employee_tasks(supabase, emp_id, view='list'):
+    resp = supabase.table('tasks').select(TASK_COLUMNS[view]).eq('assigned_to', emp_id).execute()
+    return resp.data or []
+
+def get_completed_tasks(supabase, manager_id, view='list'):
+    resp = supabase.table('tasks').select(TASK_COLUMNS[view]).eq('status', 'completed').eq('assigned_by', manager_id).execute()
     return resp.data or []
 
+def get_task_details(supabase, task_id):
+    resp = supabase.table('tasks').select(TASK_COLUMNS['detail']).eq('id', task_id).execute()
+    return resp.data[0] if resp.data else None
+
+def get_employees(supabase):
+    load = lambda: supabase.table('users').select(USER_COLUMNS['list']).eq('role', 'employee').execute().data or []
+    if EMPLOYEE_CACHE_TTL <= 0:
+        return load()
+    # shared by every worker, dropped on signup
+    return get_shared_cache().cached('employees', EMPLOYEE_CACHE_TTL, load)
+
+def get_users_by_ids(supabase, user_ids, view='list'):
+    user_ids = [u for u in user_ids if u is not None]
+    if not user_ids:
+        return {}
+    resp = supabase.table('users').select(USER_COLUMNS[view]).in_('id', user_ids).execute()
+    return {u['id']: u for u in resp.data or []}
+
 def get_employee_details(supabase, emp_id):
-    resp = supabase.table('users').select("*").eq('id', emp_id).execute()
+    resp = with_optional_columns('users', USER_COLUMNS['profile'],
+                                 lambda cols: supabase.table('users').select(",".join(cols)).eq('id', emp_id).execute())
     return resp.data[0] if resp.data else None
 
-def create_task( title, desc, emp_id, manager_id, due_datetime_iso,supabase = get_db()):
+def _record_task_write(task):
+    # the search index and workload counters are local caches, a failed update must never fail the write itself
+    from . import search, workload
+    try:
+        if 'title' in task:
+            search.index_task(task)
+        else:
+            search.update_task_status(task['id'], task['status'])
+    except Exception as e:
+        logger.error(f"Search index update failed for task {task['id']}: {e}")
+    try:
+        workload.record_task(task)
+    except Exception as e:
+        logger.error(f"Workload update failed for task {task['id']}: {e}")
+
+def create_task( title, desc, emp_id, manager_id, due_datetime_iso,supabase = None):
+    supabase = supabase or get_db()
     task_data = {
         'title': title,
         'assigned_to': emp_id,
@@ -72,7 +167,36 @@ def create_task( title, desc, emp_id, manager_id, due_datetime_iso,supabase = ge
         'description': desc,
         'due_date': due_datetime_iso
     }
-    supabase.table('tasks').insert(task_data).execute()
+    rows = supabase.table('tasks').insert(task_data).execute().data
+    task = rows[0] if rows else None
+    if task:
+        _record_task_write(task)
+    return task
+
+def _update_task_row(supabase, task_id, fields):
+    # the update returns the stored row, so the local indexes see every column and not just the changed ones
+    rows = with_optional_columns('tasks', fields, lambda cols: (
+        supabase.table('tasks').update({c: fields[c] for c in cols}).eq('id', task_id).execute())).data
+    return rows[0] if rows else {'id': task_id, **{c: v for c, v in fields.items() if column_available('tasks', c)}}
+
+def _completion_fields(fields, was_completed):
+    # completed_at is stamped on the transition only, the on-time verdict is read from it later
+    if 'status' not in fields or (fields['status'] == 'completed') == was_completed:
+        return fields
+    return {**fields, 'completed_at': get_ist_now().isoformat() if fields['status'] == 'completed' else None}
+
+def update_task(supabase, task, fields):
+    """Applies fields to an existing task row (as read with the detail view) and reindexes it."""
+    row = _update_task_row(supabase, task['id'], _completion_fields(fields, task.get('status') == 'completed'))
+    updated = {**task, **row}
+    _record_task_write(updated)
+    return updated
+
+def update_task_progress(supabase, task_id, progress):
+    status = 'completed' if progress == 100 else 'pending'
+    fields = {'progress': progress, 'status': status, 'completed_at': get_ist_now().isoformat() if progress == 100 else None}
+    _record_task_write(_update_task_row(supabase, task_id, fields))
+    return status
 
 def send_notification(supabase, recipient_id, content, msg_type):
     supabase.table('messages').insert({
@@ -81,33 +205,23 @@ def send_notification(supabase, recipient_id, content, msg_type):
         'message_type': msg_type
     }).execute()
 
-def get_notifications(supabase, user_id):
-    resp = supabase.table('messages').select("*").eq('recipient_id', user_id).order('created_at', desc=True).execute()
-    return resp.data or []
+def send_notifications(supabase, rows):
+    # one round trip for several recipients
+    if rows:
+        supabase.table('messages').insert(rows).execute()
 
-def check_all_deadlines(supabase):
-    ist = timezone(timedelta(hours=5, minutes=30))
-    now = get_ist_now()
-    warning_time = now + timedelta(hours=24)
-
-    resp = supabase.table('tasks').select("*").eq('status', 'pending').execute()
-    tasks = resp.data or []
+def get_notifications(supabase, user_id, limit=None):
+    query = supabase.table('messages').select(MESSAGE_COLUMNS['list']).eq('recipient_id', user_id).order('created_at', desc=True)
+    if limit:
+        query = query.limit(limit)
+    return query.execute().data or []
 
-    for task in tasks:
-        if task.get('warning_sent'):
-            continue
-            
-        due_date = datetime.fromisoformat(task['due_date']).astimezone(ist) if task['due_date'] else None
-        
-        if due_date and now < due_date < warning_time and task['progress'] < 100:
-            msg = f"⏰ URGENT: Task '{task['title']}' is due in less than 24 hours!"
-            
-            send_notification(supabase, task['assigned_to'], msg, 'warning')
-            send_notification(supabase, task['assigned_by'], msg, 'warning')
-            
-            supabase.table('tasks').update({'warning_sent': True}).eq('id', task['id']).execute()
+def check_all_deadlines(supabase):
+    from .escalation import run_escalations
+    return run_escalations(supabase)
 # ----- EMAIL & WHATSAPP UTILITIES -----
 
+@traced('outbound', 'email')
 def send_email(to_email: str, subject: str, html_body: str) -> bool:
     """
     Send email via SendGrid or SMTP (if configured).
@@ -165,6 +279,7 @@ def send_email(to_email: str, subject: str, html_body: str) -> bool:
         logger.warning("No email service configured")
         return False
 
+@traced('outbound', 'whatsapp')
 def send_whatsapp(to_number: str, message: str) -> bool:
     """
     Send WhatsApp message via Twilio.
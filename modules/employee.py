@@ -1,21 +1,23 @@
 import streamlit as st
-from .database import get_notifications, send_notification
+from .database import get_notifications, send_notification, get_employee_tasks, get_task_details, update_task_progress
 from .utils import format_datetime_ist
+from .write_behind import get_write_queue, Entry
 import time
 
-def render_employee_dashboard(supabase, user_id, user_name):
+def render_employee_dashboard(supabase, user_id, user_name, tz=None):
     st.header("My Tasks")
     
     render_alerts_section(supabase, user_id)
     st.divider()
-    render_tasks_section(supabase, user_id, user_name)
+    render_tasks_section(supabase, user_id, user_name, tz)
 
 def render_alerts_section(supabase, user_id):
     st.subheader(" Alerts ")
-    msgs = get_notifications(supabase, user_id)
+    msgs = get_notifications(supabase, user_id, limit=5)
+    forget_edited_details(msgs)
     
     if msgs:
-        for m in msgs[:5]:  # Show newest 5 first (already ordered desc by DB query)
+        for m in msgs:  # Show newest 5 first (already ordered desc by DB query)
             if m['message_type'] == 'warning':
                 st.warning(m['content'])
             elif m['message_type'] == 'completion':
@@ -27,55 +29,109 @@ def render_alerts_section(supabase, user_id):
     else:
         st.info("No alerts")
 
-def render_tasks_section(supabase, user_id, user_name):
-    resp = supabase.table('tasks').select("*").eq('assigned_to', user_id).execute()
-    my_tasks = resp.data or []
+def render_tasks_section(supabase, user_id, user_name, tz=None):
+    my_tasks = apply_pending_progress(get_employee_tasks(supabase, user_id))
     
     if not my_tasks:
         st.info("No tasks assigned yet.")
         return
     
+    render_sync_status([t['id'] for t in my_tasks])
     completed = [t for t in my_tasks if t['status'] == 'completed']
     pending = [t for t in my_tasks if t['status'] == 'pending']
     
     if pending:
         st.subheader("Pending Tasks...")
         for task in pending:
-            render_pending_task(supabase, task, user_name)
+            render_pending_task(supabase, task, user_name, tz)
     
     if completed:
         st.subheader("✅ Completed Tasks")
         for task in completed:
             with st.container(border=True):
                 st.write(f"### {task['title']}")
-                st.write(f"📅 {format_datetime_ist(task['due_date'])}")
+                st.write(f"📅 {format_datetime_ist(task['due_date'], tz)}")
                 st.write("Status: ✅ COMPLETED")
 
-def render_pending_task(supabase, task, user_name):
+def forget_edited_details(msgs):
+    # a new task_edited alert means some description may have changed, refetch on next expand
+    edits = [m['id'] for m in msgs if m['message_type'] == 'task_edited']
+    latest = edits[0] if edits else None
+    if st.session_state.get('details_edit_seen') != latest:
+        for key in [k for k in st.session_state if k.startswith('details_')]:
+            del st.session_state[key]
+        st.session_state['details_edit_seen'] = latest
+
+def render_task_details(supabase, task_id):
+    # description is only fetched once the task is expanded, then kept until the next task_edited alert
+    key = f"details_{task_id}"
+    if key not in st.session_state:
+        st.session_state[key] = get_task_details(supabase, task_id) or {}
+    desc = st.session_state[key].get('description')
+    if desc:
+        st.write(f"**Desc:** {desc}")
+    else:
+        st.caption("No description")
+
+def apply_pending_progress(tasks):
+    # optimistic view: saves still queued or in flight override what the db returned
+    queue = get_write_queue()
+    for task in tasks:
+        entry = queue.get(task['id'])
+        if entry is None or entry.status == Entry.FAILED:
+            continue
+        task['progress'] = entry.value
+        task['status'] = 'completed' if entry.value == 100 else 'pending'
+        if entry.status == Entry.SAVED:
+            queue.acknowledge(task['id'])
+    return tasks
+
+def render_sync_status(task_ids):
+    if get_write_queue().pending_count(set(task_ids)):
+        render_sync_progress(task_ids)
+    else:
+        st.caption("☁️ All changes saved")
+
+@st.fragment(run_every=1)
+def render_sync_progress(task_ids):
+    pending = get_write_queue().pending_count(set(task_ids))
+    if pending:
+        st.caption(f"🔄 Saving {pending} change{'s' if pending > 1 else ''}…")
+    else:
+        # settled, rerun the page so it shows what was stored and rolls back failed saves
+        st.rerun()
+
+def save_progress(supabase, task, progress, user_name):
+    update_task_progress(supabase, task['id'], progress)
+    if progress == 100:
+        msg = f"✅ '{task['title']}' completed by {user_name}!"
+        send_notification(supabase, task['assigned_by'], msg, 'completion')
+
+def queue_progress_save(supabase, task, user_name):
+    # runs as the button callback, before the page reruns, so the rerun already shows the new value
+    progress = st.session_state[f"p_{task['id']}"]
+    get_write_queue().submit(task['id'], progress, task['progress'],
+                             lambda value: save_progress(supabase, task, value, user_name))
+    st.toast("✅ Completed! Manager will be notified." if progress == 100 else f"💾 {progress}%")
+
+def render_pending_task(supabase, task, user_name, tz=None):
+    queue = get_write_queue()
+    entry = queue.get(task['id'])
+    if entry is not None and entry.status == Entry.FAILED:
+        # roll the slider back to the stored value
+        st.session_state.pop(f"p_{task['id']}", None)
+        st.error(f"⚠️ Couldn't save '{task['title']}', progress is back at {entry.confirmed}%.")
+        queue.acknowledge(task['id'])
+
     with st.container(border=True):
         col1, col2 = st.columns([3, 1])
         
         with col1:
             st.write(f"### {task['title']}")
-            if task['description']:
-                st.write(f"**Desc:** {task['description']}")
-            st.write(f"📅 **Due:** {format_datetime_ist(task['due_date'])}")
+            st.write(f"📅 **Due:** {format_datetime_ist(task['due_date'], tz)}")
+            if st.toggle("Details", key=f"d_{task['id']}"):
+                render_task_details(supabase, task['id'])
         
         with col2:
-            new_prog = st.slider("Progress", 0, 100, task['progress'], key=f"p_{task['id']}", label_visibility="collapsed")
-            
-            if st.button("💾 Save", key=f"s_{task['id']}", ):
-                status = 'completed' if new_prog == 100 else 'pending'
-                supabase.table('tasks').update({
-                    'progress': new_prog,
-                    'status': status
-                }).eq('id', task['id']).execute()
-                
-                if new_prog == 100:
-                    msg = f"✅ '{task['title']}' completed by {user_name}!"
-                    send_notification(supabase, task['assigned_by'], msg, 'completion')
-                    st.success("✅ Completed! Manager notified.")
-                else:
-                    st.success(f"💾 {new_prog}%")
-                
-                st.rerun()
+            st.slider("Progress", 0, 100, task['progress'], key=f"p_{task['id']}", label_visibility="collapsed")
+            st.button("💾 Save", key=f"s_{task['id']}", on_click=queue_progress_save, args=(supabase, task, user_name))
@@ -0,0 +1,117 @@
+import logging
+import os
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+from .database import TASK_COLUMNS, send_notifications, with_optional_columns, column_available
+from .shared_cache import get_shared_cache
+from .utils import get_ist_now
+
+logger = logging.getLogger(__name__)
+
+# deadline escalation tiers. each tier owns a disjoint due-date window relative to now,
+# so a sweep is one range scan per tier instead of a pass over every pending task
+
+Tier = namedtuple('Tier', ['name', 'start_hours', 'end_hours', 'message'])
+
+OVERDUE_LOOKBACK_HOURS = 7 * 24
+
+ESCALATION_TIERS = [
+    Tier('overdue', -OVERDUE_LOOKBACK_HOURS, 0, "🚨 OVERDUE: Task '{title}' has passed its deadline!"),
+    Tier('2h', 0, 2, "🔥 Task '{title}' is due in less than 2 hours!"),
+    Tier('24h', 2, 24, "⏰ URGENT: Task '{title}' is due in less than 24 hours!"),
+    Tier('72h', 24, 72, "📅 Task '{title}' is due in less than 3 days."),
+]
+
+SWEEP_PAGE_SIZE = 500
+SWEEP_INTERVAL = int(os.getenv("DEADLINE_SWEEP_INTERVAL", "300"))
+
+def sent_tiers(task):
+    sent = set(task.get('escalations_sent') or [])
+    # rows flagged by the old single-rule sweep count as having had the 24h warning
+    if task.get('warning_sent'):
+        sent.add('24h')
+    return sent
+
+def iter_due_pages(supabase, tier, now, page_size=SWEEP_PAGE_SIZE):
+    """
+    Yields pages of pending tasks inside the tier's window that haven't had this tier yet.
+    Already escalated tasks are filtered out by the database, and pages follow a
+    (due_date, id) cursor so a late page costs the same as the first.
+    """
+    lower = (now + timedelta(hours=tier.start_hours)).isoformat()
+    upper = (now + timedelta(hours=tier.end_hours)).isoformat()
+    cursor = None
+
+    def fetch(cols):
+        query = (supabase.table('tasks').select(",".join(cols))
+                 .eq('status', 'pending')
+                 .lt('progress', 100)
+                 .gt('due_date', lower)
+                 .lte('due_date', upper))
+        if 'escalations_sent' in cols:
+            query = query.not_.contains('escalations_sent', [tier.name])
+        if tier.name == '24h':
+            # rows flagged by the old single-rule sweep
+            query = query.not_.is_('warning_sent', 'true')
+        if cursor:
+            due, last_id = cursor
+            query = query.or_(f'due_date.gt."{due}",and(due_date.eq."{due}",id.gt.{last_id})')
+        return query.order('due_date').order('id').limit(page_size).execute()
+
+    while True:
+        page = with_optional_columns('tasks', TASK_COLUMNS['sweep'], fetch).data or []
+        due = [t for t in page if tier.name not in sent_tiers(t)]
+        if due:
+            yield due
+        if len(page) < page_size:
+            return
+        cursor = (page[-1]['due_date'], page[-1]['id'])
+
+def escalate_page(supabase, tasks, tier):
+    # one insert for all notifications on the page, one update per distinct marker set
+    rows = []
+    by_markers = defaultdict(list)
+    for task in tasks:
+        msg = tier.message.format(title=task['title'])
+        for recipient in {task['assigned_to'], task['assigned_by']} - {None}:
+            rows.append({'recipient_id': recipient, 'content': msg, 'message_type': 'warning'})
+        by_markers[tuple(sorted(sent_tiers(task) | {tier.name}))].append(task['id'])
+
+    send_notifications(supabase, rows)
+    for sent, ids in by_markers.items():
+        fields = {'escalations_sent': list(sent), 'warning_sent': '24h' in sent}
+        with_optional_columns('tasks', fields, lambda cols: (
+            supabase.table('tasks').update({c: fields[c] for c in cols}).in_('id', ids).execute()))
+
+def tier_recordable(tier):
+    # without the escalations_sent column only the legacy warning_sent flag can be stored,
+    # so only the 24h tier can run without repeating itself every sweep
+    return tier.name == '24h' or column_available('tasks', 'escalations_sent')
+
+def run_escalations(supabase, now=None, tiers=ESCALATION_TIERS, page_size=SWEEP_PAGE_SIZE):
+    now = now or get_ist_now()
+    counts = {}
+    for tier in tiers:
+        counts[tier.name] = 0
+        if not tier_recordable(tier):
+            continue
+        for page in iter_due_pages(supabase, tier, now, page_size):
+            if not tier_recordable(tier):
+                break
+            try:
+                escalate_page(supabase, page, tier)
+                counts[tier.name] += len(page)
+            except Exception as e:
+                logger.error(f"Escalation '{tier.name}' failed for tasks {[t['id'] for t in page]}: {e}")
+    if any(counts.values()):
+        logger.info(f"Deadline sweep sent {counts}")
+    return counts
+
+def run_scheduled_sweep(supabase, interval=SWEEP_INTERVAL):
+    """
+    Runs the sweep at most once per interval across all processes on the host.
+    The lease is left to expire rather than released, which is what spaces the sweeps out.
+    """
+    if not get_shared_cache().acquire_lease('deadline_sweep', interval):
+        return None
+    return run_escalations(supabase)
@@ -0,0 +1,226 @@
+import csv
+import io
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from .database import get_users_by_ids, with_optional_columns
+from .utils import get_ist_now, completed_on_time, IST
+
+# page-by-page export of tasks, per-employee stats and notification history to csv/parquet.
+# only one page of rows is held in memory at a time while streaming (the /export endpoint).
+# streamlit has to hand the browser a whole file, so its download is capped at max_rows and
+# larger audits go through /export
+
+EXPORT_PAGE_SIZE = 1000
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+DATASETS = {
+    'tasks': {
+        'table': 'tasks',
+        'columns': ['id', 'title', 'description', 'status', 'progress', 'due_date', 'assigned_to', 'assigned_by', 'created_at'],
+        'date_column': 'due_date',
+    },
+    'notifications': {
+        'table': 'messages',
+        'columns': ['id', 'recipient_id', 'content', 'message_type', 'created_at'],
+        'date_column': 'created_at',
+    },
+    'stats': {
+        'columns': ['employee_id', 'employee_name', 'total_tasks', 'completed_tasks', 'pending_tasks',
+                    'completion_rate', 'on_time', 'delayed', 'avg_progress'],
+    },
+}
+
+def date_bounds(start=None, end=None, tz=None):
+    """Turns an inclusive date range into [lower, upper) ISO timestamps."""
+    tz = tz or IST
+    lower = datetime.combine(start, time.min).replace(tzinfo=tz).isoformat() if start else None
+    upper = datetime.combine(end + timedelta(days=1), time.min).replace(tzinfo=tz).isoformat() if end else None
+    return lower, upper
+
+def resolve_columns(dataset, columns=None):
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown dataset '{dataset}'")
+    allowed = DATASETS[dataset]['columns']
+    if not columns:
+        return list(allowed)
+    unknown = [c for c in columns if c not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown columns for {dataset}: {unknown}")
+    return [c for c in allowed if c in columns]
+
+def iter_pages(supabase, dataset, columns, lower=None, upper=None, filters=None, page_size=EXPORT_PAGE_SIZE, after_id=None):
+    """Keyset pagination on id so late pages cost the same as early ones."""
+    spec = DATASETS[dataset]
+    select_cols = columns if 'id' in columns else ['id'] + columns
+    last_id = after_id
+    while True:
+        query = supabase.table(spec['table']).select(",".join(select_cols))
+        for column, value in (filters or {}).items():
+            query = query.in_(column, list(value)) if isinstance(value, (list, set, tuple)) else query.eq(column, value)
+        if lower:
+            query = query.gte(spec['date_column'], lower)
+        if upper:
+            query = query.lt(spec['date_column'], upper)
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        page = query.order('id').limit(page_size).execute().data or []
+        if not page:
+            return
+        last_id = page[-1]['id']
+        yield [{c: row.get(c) for c in columns} for row in page]
+        if len(page) < page_size:
+            return
+
+def iter_optional_pages(supabase, dataset, columns, *args, **kwargs):
+    """iter_pages that leaves out optional columns the table doesn't have yet, their keys are then absent."""
+    def first_page(cols):
+        pages = iter_pages(supabase, dataset, cols, *args, **kwargs)
+        return pages, next(pages, None)
+
+    pages, page = with_optional_columns(DATASETS[dataset]['table'], columns, first_page)
+    while page is not None:
+        yield page
+        page = next(pages, None)
+
+def iter_stats_pages(supabase, manager_id, columns, lower=None, upper=None, page_size=EXPORT_PAGE_SIZE):
+    # aggregates while streaming tasks, so memory grows with the team size, not the task count
+    totals = defaultdict(lambda: defaultdict(float))
+    task_cols = ['assigned_to', 'status', 'progress', 'due_date', 'completed_at']
+    for page in iter_optional_pages(supabase, 'tasks', task_cols, lower, upper, {'assigned_by': manager_id}, page_size):
+        for t in page:
+            s = totals[t['assigned_to']]
+            s['total_tasks'] += 1
+            s['progress'] += t['progress'] or 0
+            if t['status'] == 'completed':
+                s['completed_tasks'] += 1
+                on_time = completed_on_time(t['due_date'], t.get('completed_at'))
+                if on_time is not None:
+                    s['on_time' if on_time else 'delayed'] += 1
+            elif t['status'] == 'pending':
+                s['pending_tasks'] += 1
+
+    names = get_users_by_ids(supabase, list(totals))
+    rows = []
+    for emp_id, s in totals.items():
+        total = s['total_tasks']
+        row = {
+            'employee_id': emp_id,
+            'employee_name': names.get(emp_id, {}).get('full_name'),
+            'total_tasks': int(total),
+            'completed_tasks': int(s['completed_tasks']),
+            'pending_tasks': int(s['pending_tasks']),
+            'completion_rate': round(s['completed_tasks'] / total * 100, 2) if total else 0.0,
+            'on_time': int(s['on_time']),
+            'delayed': int(s['delayed']),
+            'avg_progress': round(s['progress'] / total, 2) if total else 0.0,
+        }
+        rows.append({c: row[c] for c in columns})
+        if len(rows) >= page_size:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+def cap_rows(pages, max_rows):
+    total = 0
+    for page in pages:
+        total += len(page)
+        if total > max_rows:
+            raise ValueError(f"Export is larger than {max_rows} rows, narrow the date range or use the /export API")
+        yield page
+
+def stream_csv(pages, columns):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+    yield buf.getvalue().encode()
+    for page in pages:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(page)
+        yield buf.getvalue().encode()
+
+class _ChunkSink(io.RawIOBase):
+    # file-like target for ParquetWriter that hands back what was written since the last drain
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError("Parquet export needs pyarrow installed")
+
+def stream_parquet(pages, columns):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    writer = None
+    schema = None
+    for page in pages:
+        if writer is None:
+            inferred = pa.Table.from_pylist(page).select(columns).schema
+            # columns that are all null on the first page would otherwise be typed as null
+            schema = pa.schema([pa.field(f.name, pa.string() if pa.types.is_null(f.type) else f.type) for f in inferred])
+            writer = pq.ParquetWriter(sink, schema)
+        writer.write_table(pa.Table.from_pylist(page, schema=schema))
+        yield sink.drain()
+    if writer is None:
+        schema = pa.schema([pa.field(c, pa.string()) for c in columns])
+        writer = pq.ParquetWriter(sink, schema)
+    writer.close()
+    yield sink.drain()
+
+def export_stream(supabase, dataset, fmt='csv', columns=None, start=None, end=None,
+                  manager_id=None, recipient_ids=None, tz=None, page_size=EXPORT_PAGE_SIZE, max_rows=None):
+    """
+    Returns (chunk iterator, media type, file name). Nothing is read until the iterator is consumed;
+    with max_rows set, consuming it raises ValueError once the export passes that many rows.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'")
+    if fmt == 'parquet':
+        _require_pyarrow()
+    if dataset == 'stats' and manager_id is None:
+        raise ValueError("manager_id is required for the stats export")
+    columns = resolve_columns(dataset, columns)
+    lower, upper = date_bounds(start, end, tz)
+
+    if dataset == 'stats':
+        pages = iter_stats_pages(supabase, manager_id, columns, lower, upper, page_size)
+    else:
+        filters = {}
+        if dataset == 'tasks' and manager_id is not None:
+            filters['assigned_by'] = manager_id
+        if dataset == 'notifications' and recipient_ids is not None:
+            filters['recipient_id'] = recipient_ids
+        pages = iter_pages(supabase, dataset, columns, lower, upper, filters, page_size)
+
+    if max_rows is not None:
+        pages = cap_rows(pages, max_rows)
+    media_type, ext = FORMATS[fmt]
+    chunks = stream_parquet(pages, columns) if fmt == 'parquet' else stream_csv(pages, columns)
+    filename = f"{dataset}_{get_ist_now(tz).strftime('%Y%m%d_%H%M')}.{ext}"
+    return chunks, media_type, filename
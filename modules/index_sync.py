@@ -0,0 +1,54 @@
+import logging
+import os
+import threading
+import time
+from . import search, workload
+from .escalation import run_scheduled_sweep
+
+logger = logging.getLogger(__name__)
+
+# keeps this host's local indexes in step with supabase from a background thread, so no
+# page render or request ever waits on a catch-up or a rebuild. the streamlit host also runs
+# its deadline sweeps from here
+
+SYNC_INTERVAL = int(os.getenv("INDEX_SYNC_INTERVAL", "30"))
+REBUILD_INTERVAL = int(os.getenv("INDEX_REBUILD_INTERVAL", "900"))
+
+SYNCS = [('search', search.sync_index), ('workload', workload.sync_workload)]
+
+_thread = None
+_thread_pid = None
+_lock = threading.Lock()
+
+def sync_local_indexes(supabase, names=None, rebuild_interval=REBUILD_INTERVAL):
+    for name, sync in SYNCS:
+        if names is not None and name not in names:
+            continue
+        try:
+            sync(supabase, rebuild_interval)
+        except Exception as e:
+            logger.error(f"Local {name} index sync failed: {e}")
+
+def _run(supabase, names, interval, sweep):
+    while True:
+        if sweep:
+            try:
+                # the shared lease keeps it to one sweep per SWEEP_INTERVAL on the host
+                run_scheduled_sweep(supabase)
+            except Exception as e:
+                logger.error(f"Deadline sweep failed: {e}")
+        sync_local_indexes(supabase, names)
+        time.sleep(interval)
+
+def start_index_sync(supabase, names=None, interval=SYNC_INTERVAL, sweep=False):
+    """
+    Starts the sync thread once per process (for the named indexes, all by default), later calls
+    are no-ops. With sweep the thread also runs the deadline sweep when it is due.
+    """
+    global _thread, _thread_pid
+    with _lock:
+        if _thread is not None and _thread.is_alive() and _thread_pid == os.getpid():
+            return
+        _thread = threading.Thread(target=_run, args=(supabase, names, interval, sweep), name="index-sync", daemon=True)
+        _thread_pid = os.getpid()
+        _thread.start()
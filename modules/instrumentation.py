@@ -0,0 +1,274 @@
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+logger = logging.getLogger(__name__)
+
+# per-request spans for db queries, llm calls and outbound senders, summed per host for /metrics
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FILTER_METHODS = {'eq', 'neq', 'gt', 'gte', 'lt', 'lte', 'like', 'ilike', 'in_', 'is_', 'contains', 'order', 'limit', 'range'}
+ACTION_METHODS = {'select', 'insert', 'update', 'upsert', 'delete'}
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+# (family, type, series) in the order /metrics renders them
+METRIC_FAMILIES = [
+    ('app_span_seconds', 'histogram', ('app_span_seconds_bucket', 'app_span_seconds_sum', 'app_span_seconds_count')),
+    ('app_span_rows_total', 'counter', ('app_span_rows_total',)),
+    ('app_span_bytes_total', 'counter', ('app_span_bytes_total',)),
+    ('app_span_errors_total', 'counter', ('app_span_errors_total',)),
+    ('app_requests_total', 'counter', ('app_requests_total',)),
+    ('app_request_seconds_total', 'counter', ('app_request_seconds_total',)),
+    ('app_request_queries_total', 'counter', ('app_request_queries_total',)),
+]
+
+_current_trace = contextvars.ContextVar('request_trace', default=None)
+
+class Span:
+    __slots__ = ('kind', 'name', 'op', 'detail', 'rows', 'bytes', 'seconds', 'error')
+
+    def __init__(self, kind, name, op='', detail='', rows=0, bytes=0, seconds=0.0, error=False):
+        self.kind = kind
+        self.name = name
+        self.op = op
+        self.detail = detail
+        self.rows = rows
+        self.bytes = bytes
+        self.seconds = seconds
+        self.error = error
+
+    def as_dict(self):
+        return {s: getattr(self, s) for s in self.__slots__}
+
+class RequestTrace:
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def add(self, span):
+        self.spans.append(span)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def query_count(self):
+        return sum(1 for s in self.spans if s.kind == 'db')
+
+    def repeated_queries(self, threshold=3):
+        # same table + op + filter shape issued many times in one request is usually an N+1
+        shapes = Counter((s.name, s.op, s.detail) for s in self.spans if s.kind == 'db')
+        return [(shape, n) for shape, n in shapes.most_common() if n >= threshold]
+
+class MetricsRegistry:
+    """
+    Counts locally and flushes the deltas into the shared sqlite cache every FLUSH_INTERVAL,
+    so /metrics reports the sum over every worker on the host, whichever one answers.
+    """
+
+    def __init__(self, flush_interval=METRICS_FLUSH_INTERVAL):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(float)
+        self.flush_interval = flush_interval
+        self._thread = None
+        self._thread_pid = None
+
+    def _add(self, metric, labels, value):
+        self._pending[(metric, labels)] += value
+
+    def _ensure_flusher(self):
+        if self._thread is None or not self._thread.is_alive() or self._thread_pid != os.getpid():
+            self._thread = threading.Thread(target=self._run, name="metrics-flush", daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Metrics flush failed: {e}")
+
+    def observe_span(self, span):
+        labels = f'kind="{span.kind}",name="{span.name}",op="{span.op}"'
+        with self._lock:
+            self._add('app_span_seconds_count', labels, 1)
+            self._add('app_span_seconds_sum', labels, span.seconds)
+            self._add('app_span_rows_total', labels, span.rows)
+            self._add('app_span_bytes_total', labels, span.bytes)
+            if span.error:
+                self._add('app_span_errors_total', labels, 1)
+            for bound in LATENCY_BUCKETS:
+                if span.seconds <= bound:
+                    self._add('app_span_seconds_bucket', f'{labels},le="{bound}"', 1)
+            self._add('app_span_seconds_bucket', f'{labels},le="+Inf"', 1)
+            self._ensure_flusher()
+
+    def observe_request(self, trace):
+        labels = f'request="{trace.name}"'
+        with self._lock:
+            self._add('app_requests_total', labels, 1)
+            self._add('app_request_seconds_total', labels, trace.elapsed())
+            self._add('app_request_queries_total', labels, trace.query_count())
+            self._ensure_flusher()
+
+    def flush(self):
+        from .shared_cache import get_shared_cache
+
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(float)
+        if not pending:
+            return
+        try:
+            get_shared_cache().add_metrics(pending)
+        except Exception:
+            # keep the deltas for the next flush
+            with self._lock:
+                for key, value in pending.items():
+                    self._pending[key] += value
+            raise
+
+    def totals(self):
+        from .shared_cache import get_shared_cache
+
+        self.flush()
+        return get_shared_cache().read_metrics()
+
+    def render_prometheus(self):
+        totals = self.totals()
+        lines = []
+        for family, kind, metrics in METRIC_FAMILIES:
+            lines.append(f'# TYPE {family} {kind}')
+            for metric in metrics:
+                rows = [(labels, value) for (m, labels), value in totals.items() if m == metric]
+                if metric == 'app_span_seconds_bucket':
+                    # le is the last label, buckets of a series have to come out in bound order
+                    rows.sort(key=lambda r: (r[0].rsplit(',le=', 1)[0], float(r[0].rsplit('"', 2)[-2])))
+                else:
+                    rows.sort()
+                for labels, value in rows:
+                    shown = int(value) if value == int(value) else f"{value:.6f}"
+                    lines.append(f'{metric}{{{labels}}} {shown}')
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = MetricsRegistry()
+
+def start_request(name):
+    trace = RequestTrace(name)
+    _current_trace.set(trace)
+    return trace
+
+def finish_request(trace):
+    REGISTRY.observe_request(trace)
+    slow = [s for s in trace.spans if s.seconds > 1]
+    if slow or trace.repeated_queries():
+        logger.info(f"{trace.name}: {trace.query_count()} queries in {trace.elapsed():.3f}s, "
+                    f"{len(slow)} slow spans, repeated: {trace.repeated_queries()}")
+
+def current_trace():
+    return _current_trace.get()
+
+def record_span(span):
+    REGISTRY.observe_span(span)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(span)
+
+def _payload_size(data):
+    try:
+        return len(json.dumps(data, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+class _TracedQuery:
+    def __init__(self, builder, table, op='select', shape=()):
+        self._builder = builder
+        self._table = table
+        self._op = op
+        self._shape = shape
+
+    def __getattr__(self, attr):
+        target = getattr(self._builder, attr)
+        if not callable(target):
+            # e.g. .not_ returns another builder
+            return _TracedQuery(target, self._table, self._op, self._shape + (attr,)) if hasattr(target, 'execute') else target
+
+        def call(*args, **kwargs):
+            result = target(*args, **kwargs)
+            if not hasattr(result, 'execute'):
+                return result
+            op = attr if attr in ACTION_METHODS else self._op
+            shape = self._shape
+            if attr in FILTER_METHODS:
+                column = args[0] if args and attr not in ('limit', 'range') else ''
+                shape = shape + (f"{attr}({column})",)
+            return _TracedQuery(result, self._table, op, shape)
+        return call
+
+    def execute(self):
+        shape = ' '.join(self._shape)
+        start = time.perf_counter()
+        try:
+            resp = self._builder.execute()
+        except Exception:
+            record_span(Span('db', self._table, self._op, shape, seconds=time.perf_counter() - start, error=True))
+            raise
+        seconds = time.perf_counter() - start
+        data = getattr(resp, 'data', None)
+        rows = len(data) if isinstance(data, list) else int(data is not None)
+        record_span(Span('db', self._table, self._op, shape, rows, _payload_size(data), seconds))
+        return resp
+
+class InstrumentedClient:
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name):
+        return _TracedQuery(self._client.table(name), name)
+
+    def __getattr__(self, attr):
+        return getattr(self._client, attr)
+
+def traced(kind, name=None):
+    def decorator(fn):
+        span_name = name or fn.__name__
+
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def gen_wrapper(*args, **kwargs):
+                # streamed responses are timed until the consumer drains them
+                start = time.perf_counter()
+                error = False
+                chunks = 0
+                try:
+                    for chunk in fn(*args, **kwargs):
+                        chunks += 1
+                        yield chunk
+                except Exception:
+                    error = True
+                    raise
+                finally:
+                    record_span(Span(kind, span_name, 'stream', rows=chunks, seconds=time.perf_counter() - start, error=error))
+            return gen_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            error = False
+            try:
+                result = fn(*args, **kwargs)
+                error = result is False
+                return result
+            except Exception:
+                error = True
+                raise
+            finally:
+                record_span(Span(kind, span_name, 'call', seconds=time.perf_counter() - start, error=error))
+        return wrapper
+    return decorator
@@ -1,36 +1,63 @@
+import os
 import streamlit as st
-from datetime import datetime, timedelta, timezone
+from streamlit.errors import StreamlitAPIException
 from collections import defaultdict
-from .database import get_employee_stats, send_notification
-from .utils import format_datetime_ist, to_ist_timestamp
+from functools import partial
+from datetime import timedelta
+from .database import get_employee_stats, send_notification, get_employees, get_task_details, get_team_tasks, get_users_by_ids, create_task, update_task
+from .utils import format_datetime_ist, to_ist_timestamp, parse_iso, get_ist_now, tz_label, IST
 from .analytics import render_employee_report,render_tasks_table
-from .database import get_db
+from .export import export_stream, date_bounds, DATASETS, FORMATS
+from .search import search_tasks, search_tasks_live, index_ready
+from .workload import suggest_assignees, workload_ready, describe_capacity
 import pandas as pd
 
-supabse = get_db()
+STREAMLIT_EXPORT_MAX_ROWS = int(os.getenv("STREAMLIT_EXPORT_MAX_ROWS", "50000"))
 
-def render_manager_dashboard(supabase, manager_id):
+def render_manager_dashboard(supabase, manager_id, tz=None):
     st.header("Manager Dashboard")
+    tz = tz or IST
+    now = get_ist_now(tz)
     
     st.subheader("✨ Assign New Task")
-    employees = supabase.table('users').select("*").eq('role', 'employee').execute()
-    emp_options = {e['full_name']: e['id'] for e in employees.data} if employees.data else {}
-    emp_names = {e['id'] : e['full_name'] for e in employees.data} if employees.data else {}
+    employees = get_employees(supabase)
+    emp_options = {e['full_name']: e['id'] for e in employees}
+    emp_names = {e['id'] : e['full_name'] for e in employees}
     if not emp_options:
         st.warning("No employees found. Create employee accounts first.")
         return
     
     
-    st.subheader("Edit Completed Tasks")
-    completed_resp = supabase.table('tasks').select("*").eq('status', 'completed').eq('assigned_by', manager_id).execute()
-    completed_tasks = completed_resp.data or []
+    st.subheader("🔎 Find & Edit Tasks")
+    col1, col2, col3, col4 = st.columns([3, 2, 2, 2])
+    with col1:
+        query = st.text_input("Search title or description", key="task_search")
+    with col2:
+        emp_filter = st.selectbox("Employee", ["All"] + list(emp_options.keys()), key="task_search_emp")
+    with col3:
+        status_filter = st.multiselect("Status", ['completed', 'in_progress', 'pending'], default=['completed'], key="task_search_status")
+    with col4:
+        due_range = st.date_input("Due between", value=(), key="task_search_due")
 
-    if not completed_tasks:
-        st.info("No completed tasks to edit.")
+    due_from, due_to = date_bounds(due_range[0] if len(due_range) > 0 else None,
+                                   due_range[1] if len(due_range) > 1 else (due_range[0] if due_range else None), tz)
+    ready = index_ready()
+    if not ready:
+        st.caption("Search index is still being built, matching on titles only for now.")
+    matches = (search_tasks if ready else partial(search_tasks_live, supabase))(
+        query, manager_id=manager_id,
+        employee_id=emp_options.get(emp_filter),
+        statuses=status_filter,
+        due_from=parse_iso(due_from), due_to=parse_iso(due_to),
+    )
+
+    if not matches:
+        st.info("No matching tasks.")
     else:
-        task_options = {f"{t.get('title','Untitled')} (Employee name:{emp_names[t.get('assigned_to')]})": t for t in completed_tasks}
-        selected_label = st.selectbox("Select completed task to edit", list(task_options.keys()))
-        task = task_options[selected_label]
+        task_options = {f"{t['title'] or 'Untitled'} (Employee name:{emp_names.get(t['assigned_to'], 'Unknown')}) #{t['id']}": t for t in matches}
+        selected_label = st.selectbox("Select task to edit", list(task_options.keys()))
+        # search rows carry no description, pull the full row only for the task being edited
+        task = get_task_details(supabase, task_options[selected_label]['id']) or task_options[selected_label]
 
         with st.form(f"edit_task_{task.get('id')}"):
             col1, col2 = st.columns(2)
@@ -41,30 +68,28 @@ def render_manager_dashboard(supabase, manager_id):
                 
                 due_date_val = None
                 due_time_val = None
-                try:
-                    if task.get('due_date'):
-                        parsed = datetime.fromisoformat(task['due_date'])
-                        due_date_val = parsed.date()
-                        due_time_val = parsed.time()
-                except Exception:
-                    pass
+                parsed = parse_iso(task.get('due_date'))
+                if parsed:
+                    parsed = parsed.astimezone(tz)
+                    due_date_val = parsed.date()
+                    due_time_val = parsed.time().replace(tzinfo=None)
 
-                due_date = st.date_input("Due Date", value=due_date_val or datetime.now().date())
-                due_time = st.time_input("Due Time (IST)", value=due_time_val or datetime.now().time())
+                due_date = st.date_input("Due Date", value=due_date_val or now.date())
+                due_time = st.time_input(f"Due Time ({tz_label(tz)})", value=due_time_val or now.time().replace(tzinfo=None))
 
-            new_desc = st.text_area("Description", value=task.get('description', ''))
+            new_desc = st.text_area("Description", value=task.get('description') or '')
             reopen = st.checkbox("Reopen task (set to in_progress)")
             submit_edit = st.form_submit_button("Save Changes")
 
             if submit_edit:
-                due_iso = to_ist_timestamp(due_date, due_time)
+                due_iso = to_ist_timestamp(due_date, due_time, tz)
                 updated_fields = {
                     'title': new_title,
                     'description': new_desc,
                     'due_date': due_iso,
                     'status': 'in_progress' if reopen else new_status
                 }
-                supabase.table('tasks').update(updated_fields).eq('id', task.get('id')).execute() 
+                update_task(supabase, task, updated_fields)
 
                 try:
                     send_notification(supabase, task.get('assigned_to'), f"✏️ Task '{new_title}' was edited by your manager. Please review.", 'task_edited')
@@ -77,35 +102,33 @@ def render_manager_dashboard(supabase, manager_id):
     
 
 
+    if workload_ready():
+        ranked = suggest_assignees(list(emp_names), limit=None)
+        st.caption("💡 Most available: " + ", ".join(f"{emp_names[e]} ({describe_capacity(c)})" for e, c in ranked[:3]))
+    else:
+        ranked = [(e, None) for e in emp_names]
+        st.caption("Workload data is still loading, suggestions will show shortly.")
+    capacity = dict(ranked)
+
     with st.form("new_task"):
         col1, col2 = st.columns(2)
         with col1:
-            target_emp = st.selectbox("Select Employee", list(emp_options.keys()))
+            # least loaded first, so the default pick is the suggestion
+            target_emp = st.selectbox("Select Employee", [emp_names[e] for e, _ in ranked],
+                                      format_func=lambda name: f"{name} · {describe_capacity(capacity[emp_options[name]])}" if capacity[emp_options[name]] else name)
             title = st.text_input("Task Title")
         with col2:
             due_date = st.date_input("Due Date")
-            due_time = st.time_input("Due Time (IST)")
+            due_time = st.time_input(f"Due Time ({tz_label(tz)})")
         
         details = st.text_area("Task Description")
         submit = st.form_submit_button("Assign Task")
         
         if submit and title:
             emp_id = emp_options[target_emp]
-            ist = timezone(timedelta(hours=5, minutes=30))
-            due_datetime = datetime.combine(due_date, due_time)
-            due_datetime_ist = ist.localize(due_datetime) if hasattr(ist, 'localize') else due_datetime.replace(tzinfo=ist)
-    
-            
-            task_data = {
-                'title': title, 
-                'assigned_to': emp_id, 
-                'assigned_by': manager_id,
-                'description': details,
-                'due_date': due_datetime_ist.isoformat()
-            }
-            supabase.table('tasks').insert(task_data).execute()
+            create_task(title, details, emp_id, manager_id, to_ist_timestamp(due_date, due_time, tz), supabase=supabase)
             
-            ai_msg = f"✅ New Task: '{title}' - Due {due_date.strftime('%d/%m/%Y')} at {due_time.strftime('%H:%M')} IST"
+            ai_msg = f"✅ New Task: '{title}' - Due {due_date.strftime('%d/%m/%Y')} at {due_time.strftime('%H:%M')} {tz_label(tz)}"
             send_notification(supabase, emp_id, ai_msg, 'new_task')
             
             st.success(f"✅ Task assigned to {target_emp}!")
@@ -115,10 +138,9 @@ def render_manager_dashboard(supabase, manager_id):
     
 
     st.subheader("👥 Team Progress & Reports")
-    team_response = supabase.table('tasks').select("*").eq('assigned_by', manager_id).execute()
-    team_tasks = team_response.data or []
+    team_tasks = get_team_tasks(supabase, manager_id)
     st.subheader("📊 Team Tasks")
-    render_tasks_table(team_tasks)
+    render_tasks_table(team_tasks, tz)
     
     if team_tasks:
         emp_tasks = defaultdict(list)
@@ -127,11 +149,8 @@ def render_manager_dashboard(supabase, manager_id):
             emp_tasks[task['assigned_to']].append(task)
             emp_ids.add(task['assigned_to'])
         
-        emp_details = {}
-        for emp_id in emp_ids:
-            emp_res = supabase.table('users').select("*").eq('id', emp_id).execute()
-            if emp_res.data:
-                emp_details[emp_id] = emp_res.data[0]
+        emp_details = {e['id']: e for e in employees if e['id'] in emp_ids}
+        emp_details.update(get_users_by_ids(supabase, emp_ids - emp_details.keys()))
         
         for emp_id, tasks in emp_tasks.items():
             if emp_id in emp_details:
@@ -143,7 +162,7 @@ def render_manager_dashboard(supabase, manager_id):
                     with col1:
                         for task in tasks:
                             status_color = "🟢" if task['status'] == 'completed' else "🟡"
-                            st.write(f"{status_color} **{task['title']}** | {task['progress']}% | {format_datetime_ist(task['due_date'])}")
+                            st.write(f"{status_color} **{task['title']}** | {task['progress']}% | {format_datetime_ist(task['due_date'], tz)}")
                     
                     with col2:
                         completed = len([t for t in tasks if t['status'] == 'completed'])
@@ -156,6 +175,46 @@ def render_manager_dashboard(supabase, manager_id):
                     
                     if st.session_state.get(f"show_report_{emp_id}"):
                         st.divider()
-                        render_employee_report(supabase, emp_id, emp_name)
+                        render_employee_report(supabase, emp_id, emp_name, viewer_id=manager_id)
     else:
-        st.info("No tasks assigned yet.")
\ No newline at end of file
+        st.info("No tasks assigned yet.")
+
+    st.divider()
+    # notification history is limited to people this manager has assigned tasks to
+    team_ids = sorted({t['assigned_to'] for t in team_tasks if t['assigned_to'] is not None}, key=str)
+    render_export_section(supabase, manager_id, team_ids, tz)
+
+def render_export_section(supabase, manager_id, employee_ids, tz=None):
+    st.subheader("📥 Export")
+    st.caption(f"Downloads here are limited to {STREAMLIT_EXPORT_MAX_ROWS:,} rows, larger audits go through the /export API.")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        dataset = st.selectbox("Data", list(DATASETS.keys()), key="export_dataset")
+    with col2:
+        fmt = st.selectbox("Format", list(FORMATS.keys()), key="export_format")
+    with col3:
+        today = get_ist_now(tz).date()
+        date_range = st.date_input("Date range", value=(today - timedelta(days=90), today), key="export_range")
+    columns = st.multiselect("Columns (all when empty)", DATASETS[dataset]['columns'], key=f"export_cols_{dataset}")
+
+    start = date_range[0] if len(date_range) > 0 else None
+    end = date_range[1] if len(date_range) > 1 else start
+    export_args = dict(columns=columns, start=start, end=end, manager_id=manager_id,
+                       recipient_ids=[manager_id] + employee_ids, tz=tz, max_rows=STREAMLIT_EXPORT_MAX_ROWS)
+    try:
+        # validates the options only, no rows are read until the iterator is consumed
+        _, media_type, filename = export_stream(supabase, dataset, fmt, **export_args)
+    except ValueError as e:
+        st.error(str(e))
+        return
+
+    def build_export():
+        # runs when the download is clicked, not on every rerun of the page. streamlit serves the
+        # file from memory, max_rows is what keeps this bounded
+        chunks, _, _ = export_stream(supabase, dataset, fmt, **export_args)
+        return b"".join(chunks)
+
+    try:
+        st.download_button("⬇️ Download", data=build_export, file_name=filename, mime=media_type)
+    except StreamlitAPIException as e:
+        st.error(f"Export unavailable: {e}")
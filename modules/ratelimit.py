@@ -0,0 +1,231 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from .shared_cache import get_shared_cache
+
+logger = logging.getLogger(__name__)
+
+# admission control for the gemini calls: global + per-user token buckets and a circuit breaker,
+# shared by every worker on the host through the sqlite cache
+
+class LLMUnavailable(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(f"{reason}, retry in {retry_after:.0f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+def is_quota_error(exc):
+    text = str(exc).lower()
+    return type(exc).__name__ in ('ResourceExhausted', 'TooManyRequests') or '429' in text or 'quota' in text
+
+class TokenBucket:
+    def __init__(self, rate, capacity, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now if now is not None else time.time()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=3, cooldown=60, max_cooldown=600, probe_timeout=120):
+        self.failure_threshold = failure_threshold
+        self.probe_timeout = probe_timeout
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.probe_started = 0.0
+
+    def retry_in(self, now):
+        """Seconds until a call may go through, 0 when it can go now."""
+        if self.state == self.CLOSED:
+            return 0.0
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.cooldown - now
+            if remaining > 0:
+                return remaining
+            self.state = self.HALF_OPEN
+        # half open lets exactly one probe through. a probe that never reported back
+        # (lost worker thread, hung call) stops blocking once it times out
+        if self.probe_in_flight:
+            remaining = self.probe_started + self.probe_timeout - now
+            if remaining > 0:
+                return remaining
+            self.probe_in_flight = False
+        return 0.0
+
+    def on_admit(self, now):
+        if self.state == self.HALF_OPEN:
+            self.probe_in_flight = True
+            self.probe_started = now
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+        self.probe_in_flight = False
+
+    def record_failure(self, now, quota=False):
+        self.failures += 1
+        if self.state == self.HALF_OPEN:
+            # probe failed, back off harder
+            self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+        if quota or self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"LLM circuit opened for {self.cooldown}s after {self.failures} failures")
+            self.state = self.OPEN
+            self.opened_at = now
+        self.probe_in_flight = False
+
+class AdmissionController:
+    """
+    With shared set (a callable returning the SharedCache) the bucket and breaker state lives in
+    the cache, so every worker process on the host draws from one quota and trips one breaker.
+    Without it the state is local to the process.
+    """
+
+    BREAKER_FIELDS = ('state', 'failures', 'opened_at', 'cooldown', 'probe_in_flight', 'probe_started')
+
+    def __init__(self, rate_per_min=15, burst=5, user_rate_per_min=5, user_burst=2,
+                 failure_threshold=3, cooldown=60, max_wait=5.0, max_users=1000, probe_timeout=120,
+                 shared=None, name='llm'):
+        self._lock = threading.Lock()
+        # wall clock, monotonic time isn't comparable between processes
+        now = time.time()
+        self.bucket = TokenBucket(rate_per_min / 60, burst, now)
+        self.user_rate = user_rate_per_min / 60
+        self.user_burst = user_burst
+        self.user_buckets = OrderedDict()
+        self.max_users = max_users
+        self.breaker = CircuitBreaker(failure_threshold, cooldown, probe_timeout=probe_timeout)
+        self.max_wait = max_wait
+        self.shared = shared
+        self.name = name
+
+    def _user_bucket(self, user_key, now):
+        bucket = self.user_buckets.get(user_key)
+        if bucket is None:
+            bucket = self.user_buckets[user_key] = TokenBucket(self.user_rate, self.user_burst, now)
+            if len(self.user_buckets) > self.max_users:
+                self.user_buckets.popitem(last=False)
+        self.user_buckets.move_to_end(user_key)
+        return bucket
+
+    def _load_bucket(self, cache, key, bucket):
+        saved = cache.get(key)
+        if saved:
+            bucket.tokens, bucket.updated = saved['tokens'], saved['updated']
+        else:
+            bucket.tokens, bucket.updated = bucket.capacity, time.time()
+
+    def _save_bucket(self, cache, key, bucket):
+        # an untouched bucket refills completely, after that it needn't be stored
+        cache.set(key, {'tokens': bucket.tokens, 'updated': bucket.updated}, bucket.capacity / bucket.rate + 60)
+
+    @contextmanager
+    def _state(self, user_key=None, with_user=False):
+        """Holds the state lock, loading shared state before the block and storing it after."""
+        with self._lock:
+            if self.shared is None:
+                yield
+                return
+            cache = self.shared()
+            user_key_name = f"{self.name}:bucket:user:{user_key}"
+            with cache.locked():
+                self._load_bucket(cache, f"{self.name}:bucket", self.bucket)
+                if with_user:
+                    self._load_bucket(cache, user_key_name, self._user_bucket(user_key, time.time()))
+                saved = cache.get(f"{self.name}:breaker")
+                if saved:
+                    for field in self.BREAKER_FIELDS:
+                        setattr(self.breaker, field, saved[field])
+                yield
+                self._save_bucket(cache, f"{self.name}:bucket", self.bucket)
+                if with_user:
+                    self._save_bucket(cache, user_key_name, self.user_buckets[user_key])
+                cache.set(f"{self.name}:breaker", {f: getattr(self.breaker, f) for f in self.BREAKER_FIELDS},
+                          self.breaker.max_cooldown + self.breaker.probe_timeout + 3600)
+
+    def acquire(self, user_key=None, max_wait=None):
+        """
+        Blocks until the call is admitted or raises LLMUnavailable right away
+        when it could not be admitted within max_wait seconds.
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        deadline = time.time() + max_wait
+        while True:
+            with self._state(user_key, with_user=True):
+                now = time.time()
+                breaker_wait = self.breaker.retry_in(now)
+                user_bucket = self._user_bucket(user_key, now)
+                user_wait = user_bucket.wait_time(now)
+                wait = max(breaker_wait, user_wait, self.bucket.wait_time(now))
+
+                if wait == 0:
+                    user_bucket.take(now)
+                    self.bucket.take(now)
+                    self.breaker.on_admit(now)
+                    return
+                if now + wait > deadline:
+                    if breaker_wait:
+                        reason = "LLM quota exhausted"
+                    elif user_wait:
+                        reason = "Too many AI requests from you"
+                    else:
+                        reason = "AI service is busy"
+                    raise LLMUnavailable(reason, wait)
+            time.sleep(min(wait, max(0.0, deadline - time.time())))
+
+    def record_success(self):
+        with self._state():
+            self.breaker.record_success()
+
+    def record_failure(self, exc=None):
+        with self._state():
+            self.breaker.record_failure(time.time(), quota=exc is not None and is_quota_error(exc))
+
+    @contextmanager
+    def call(self, user_key=None, max_wait=None):
+        """
+        acquire() and then record the outcome of the block. Any exit other than a clean one
+        counts as a failure, including a generator closed mid-stream (GeneratorExit), so a
+        half-open probe is always settled.
+        """
+        self.acquire(user_key, max_wait)
+        try:
+            yield
+        except BaseException as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+
+LLM_GATE = AdmissionController(
+    rate_per_min=float(os.getenv("LLM_RATE_PER_MIN", "15")),
+    burst=float(os.getenv("LLM_BURST", "5")),
+    user_rate_per_min=float(os.getenv("LLM_USER_RATE_PER_MIN", "5")),
+    user_burst=float(os.getenv("LLM_USER_BURST", "2")),
+    failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "3")),
+    cooldown=float(os.getenv("LLM_BREAKER_COOLDOWN", "60")),
+    max_wait=float(os.getenv("LLM_MAX_WAIT", "5")),
+    probe_timeout=float(os.getenv("LLM_PROBE_TIMEOUT", "120")),
+    shared=get_shared_cache if os.getenv("LLM_SHARED_STATE", "1") == "1" else None,
+)
@@ -0,0 +1,282 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from .shared_cache import get_shared_cache
+from .utils import parse_iso
+
+logger = logging.getLogger(__name__)
+
+# on-disk full text index over task titles/descriptions (sqlite fts5), kept current on every
+# task write so the manager dashboard can search instead of loading every task into a dropdown.
+# the file is per host, so writes made elsewhere (the api service, edits in supabase) are picked
+# up by sync_index: new ids every few seconds, a full rebuild every REBUILD_INTERVAL
+
+INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", os.path.join(tempfile.gettempdir(), "task_app_search.sqlite3"))
+SEARCH_LIMIT = 20
+INDEX_COLUMNS = ['id', 'title', 'description', 'status', 'assigned_to', 'assigned_by', 'due_date']
+# a crashed rebuild holds the build lease at most this long
+BUILD_LEASE_TTL = 600
+
+_local = threading.local()
+
+def _create_tables(conn, suffix=""):
+    conn.execute(f"CREATE TABLE IF NOT EXISTS task_meta{suffix} (rowid INTEGER PRIMARY KEY, task_id TEXT UNIQUE, "
+                 "title TEXT, status TEXT, assigned_to TEXT, assigned_by TEXT, due_ts REAL)")
+    conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS task_fts{suffix} USING fts5(title, description, tokenize='porter unicode61')")
+
+def _create_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS task_meta_owner ON task_meta (assigned_by, status, due_ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS task_meta_assignee ON task_meta (assigned_to, status)")
+
+def _conn():
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid() or _local.path != INDEX_PATH:
+        conn = sqlite3.connect(INDEX_PATH, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _create_tables(conn)
+        _create_indexes(conn)
+        # highest task id seen by the last rebuild or catch-up, absent until the first rebuild
+        conn.execute("CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, value TEXT)")
+        # tasks written while a rebuild runs, replayed into the new tables before the swap.
+        # status is only set for a status change on a task this copy doesn't have
+        conn.execute("CREATE TABLE IF NOT EXISTS build_log (task_id TEXT PRIMARY KEY, status TEXT)")
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.path = INDEX_PATH
+    return conn
+
+def _key(value):
+    # ids may be ints or uuids, json keeps the type so results can go straight back into queries
+    return json.dumps(value)
+
+def _due_ts(due_date):
+    due = parse_iso(due_date)
+    return due.timestamp() if due else None
+
+def _upsert(conn, task, suffix=""):
+    key = _key(task['id'])
+    row = conn.execute(f"SELECT rowid FROM task_meta{suffix} WHERE task_id = ?", (key,)).fetchone()
+    values = (task.get('title') or '', task.get('status') or 'pending', _key(task.get('assigned_to')),
+              _key(task.get('assigned_by')), _due_ts(task.get('due_date')))
+    if row:
+        rowid = row[0]
+        conn.execute(f"UPDATE task_meta{suffix} SET title = ?, status = ?, assigned_to = ?, assigned_by = ?, due_ts = ? "
+                     "WHERE rowid = ?", values + (rowid,))
+        conn.execute(f"DELETE FROM task_fts{suffix} WHERE rowid = ?", (rowid,))
+    else:
+        rowid = conn.execute(f"INSERT INTO task_meta{suffix} (task_id, title, status, assigned_to, assigned_by, due_ts) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", (key,) + values).lastrowid
+    conn.execute(f"INSERT INTO task_fts{suffix} (rowid, title, description) VALUES (?, ?, ?)",
+                 (rowid, task.get('title') or '', task.get('description') or ''))
+
+def _watermark(conn):
+    row = conn.execute("SELECT value FROM sync_state WHERE name = 'last_id'").fetchone()
+    return json.loads(row[0]) if row else None
+
+def _set_watermark(conn, last_id):
+    conn.execute("INSERT INTO sync_state (name, value) VALUES ('last_id', ?) "
+                 "ON CONFLICT(name) DO UPDATE SET value = excluded.value", (json.dumps(last_id),))
+
+def _delete(conn, key, suffix=""):
+    row = conn.execute(f"SELECT rowid FROM task_meta{suffix} WHERE task_id = ?", (key,)).fetchone()
+    if row:
+        conn.execute(f"DELETE FROM task_fts{suffix} WHERE rowid = ?", (row[0],))
+        conn.execute(f"DELETE FROM task_meta{suffix} WHERE rowid = ?", (row[0],))
+
+def _log_write(conn, key, status=None):
+    if conn.execute("SELECT 1 FROM sync_state WHERE name = 'building'").fetchone():
+        conn.execute("INSERT INTO build_log (task_id, status) VALUES (?, ?) "
+                     "ON CONFLICT(task_id) DO UPDATE SET status = excluded.status", (key, status))
+
+def _replay_build_log(conn):
+    # the live copy holds the latest state of every task written during the build,
+    # which may be newer than the page the build read it from
+    for key, status in conn.execute("SELECT task_id, status FROM build_log").fetchall():
+        live = conn.execute("SELECT m.title, m.status, m.assigned_to, m.assigned_by, m.due_ts, f.description "
+                            "FROM task_meta m JOIN task_fts f ON f.rowid = m.rowid WHERE m.task_id = ?", (key,)).fetchone()
+        if live:
+            _delete(conn, key, "_build")
+            rowid = conn.execute("INSERT INTO task_meta_build (task_id, title, status, assigned_to, assigned_by, due_ts) "
+                                 "VALUES (?, ?, ?, ?, ?, ?)", (key,) + live[:5]).lastrowid
+            conn.execute("INSERT INTO task_fts_build (rowid, title, description) VALUES (?, ?, ?)",
+                         (rowid, live[0], live[5]))
+        elif status is not None:
+            conn.execute("UPDATE task_meta_build SET status = ? WHERE task_id = ?", (status, key))
+        else:
+            _delete(conn, key, "_build")
+    conn.execute("DELETE FROM build_log")
+
+def index_task(task):
+    """Adds or replaces a task. Needs id, title, description, status, assigned_to, assigned_by and due_date."""
+    conn = _conn()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        _upsert(conn, task)
+        _log_write(conn, _key(task['id']))
+
+def update_task_status(task_id, status):
+    conn = _conn()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        key = _key(task_id)
+        updated = conn.execute("UPDATE task_meta SET status = ? WHERE task_id = ?", (status, key)).rowcount
+        _log_write(conn, key, None if updated else status)
+
+def remove_task(task_id):
+    conn = _conn()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        _delete(conn, _key(task_id))
+        _log_write(conn, _key(task_id))
+
+def rebuild_index(supabase):
+    """
+    Builds a fresh copy next to the live tables and swaps it in, so searches keep
+    answering from the old copy while supabase is paged through. Writes made in the
+    meantime land in the live copy and are carried over at the swap.
+    """
+    from .export import iter_pages
+
+    conn = _conn()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DROP TABLE IF EXISTS task_meta_build")
+        conn.execute("DROP TABLE IF EXISTS task_fts_build")
+        _create_tables(conn, "_build")
+        # from here on task writes are logged for _replay_build_log
+        conn.execute("DELETE FROM build_log")
+        conn.execute("INSERT OR REPLACE INTO sync_state (name, value) VALUES ('building', '1')")
+    count, last_id = 0, None
+    for page in iter_pages(supabase, 'tasks', INDEX_COLUMNS):
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for task in page:
+                _upsert(conn, task, "_build")
+        count += len(page)
+        last_id = page[-1]['id']
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        _replay_build_log(conn)
+        conn.execute("DELETE FROM sync_state WHERE name = 'building'")
+        conn.execute("DROP TABLE task_meta")
+        conn.execute("DROP TABLE task_fts")
+        conn.execute("ALTER TABLE task_meta_build RENAME TO task_meta")
+        conn.execute("ALTER TABLE task_fts_build RENAME TO task_fts")
+        _create_indexes(conn)
+        _set_watermark(conn, last_id)
+    logger.info(f"Search index rebuilt with {count} tasks")
+    return count
+
+def catch_up(supabase):
+    """Indexes tasks created since the last sync by any process or host."""
+    from .export import iter_pages
+
+    conn = _conn()
+    last_id = _watermark(conn)
+    count = 0
+    for page in iter_pages(supabase, 'tasks', INDEX_COLUMNS, after_id=last_id):
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for task in page:
+                _upsert(conn, task)
+            _set_watermark(conn, page[-1]['id'])
+        count += len(page)
+    return count
+
+def index_ready():
+    return _conn().execute("SELECT 1 FROM sync_state WHERE name = 'last_id'").fetchone() is not None
+
+def sync_index(supabase, rebuild_interval):
+    """
+    Full rebuild when the index was never built or rebuild_interval has passed on this host,
+    otherwise a catch-up on new ids. Rebuilds pick up edits and deletes made outside the app.
+    """
+    cache = get_shared_cache()
+    rebuild_due = cache.acquire_lease('search_rebuild', rebuild_interval)
+    if index_ready() and not rebuild_due:
+        return catch_up(supabase)
+    if not cache.acquire_lease('search_build', BUILD_LEASE_TTL):
+        return 0
+    try:
+        return rebuild_index(supabase)
+    finally:
+        cache.release_lease('search_build')
+
+def _match_expression(text):
+    # quote every token so user input can't inject fts syntax, last token matches as a prefix
+    tokens = re.findall(r"\w+", text or "")
+    if not tokens:
+        return None
+    quoted = [f'"{t}"' for t in tokens]
+    quoted[-1] += '*'
+    return " ".join(quoted)
+
+def search_tasks(text="", manager_id=None, employee_id=None, statuses=None, due_from=None, due_to=None, limit=SEARCH_LIMIT):
+    """
+    Returns up to limit rows of {id, title, status, assigned_to, due_ts}, best match first
+    (or soonest due when there is no search text).
+    """
+    where, params = [], []
+    match = _match_expression(text)
+    if match:
+        sql = ("SELECT m.task_id, m.title, m.status, m.assigned_to, m.due_ts FROM task_fts f "
+               "JOIN task_meta m ON m.rowid = f.rowid WHERE task_fts MATCH ?")
+        params.append(match)
+        order = "bm25(task_fts)"
+    else:
+        sql = "SELECT m.task_id, m.title, m.status, m.assigned_to, m.due_ts FROM task_meta m WHERE 1 = 1"
+        order = "m.due_ts IS NULL, m.due_ts"
+
+    if manager_id is not None:
+        where.append("m.assigned_by = ?")
+        params.append(_key(manager_id))
+    if employee_id is not None:
+        where.append("m.assigned_to = ?")
+        params.append(_key(employee_id))
+    if statuses:
+        where.append(f"m.status IN ({','.join('?' * len(statuses))})")
+        params.extend(statuses)
+    if due_from is not None:
+        where.append("m.due_ts >= ?")
+        params.append(due_from.timestamp())
+    if due_to is not None:
+        where.append("m.due_ts < ?")
+        params.append(due_to.timestamp())
+
+    for clause in where:
+        sql += f" AND {clause}"
+    sql += f" ORDER BY {order} LIMIT ?"
+    params.append(limit)
+
+    rows = _conn().execute(sql, params).fetchall()
+    return [
+        {'id': json.loads(r[0]), 'title': r[1], 'status': r[2], 'assigned_to': json.loads(r[3]), 'due_ts': r[4]}
+        for r in rows
+    ]
+
+def search_tasks_live(supabase, text="", manager_id=None, employee_id=None, statuses=None, due_from=None, due_to=None,
+                      limit=SEARCH_LIMIT):
+    """Same rows as search_tasks straight from supabase (title match only), used until the local index is built."""
+    query = supabase.table('tasks').select("id,title,status,assigned_to,due_date")
+    if manager_id is not None:
+        query = query.eq('assigned_by', manager_id)
+    if employee_id is not None:
+        query = query.eq('assigned_to', employee_id)
+    if statuses:
+        query = query.in_('status', list(statuses))
+    if due_from is not None:
+        query = query.gte('due_date', due_from.isoformat())
+    if due_to is not None:
+        query = query.lt('due_date', due_to.isoformat())
+    for token in re.findall(r"\w+", text or ""):
+        query = query.ilike('title', f"%{token}%")
+    rows = query.order('due_date').limit(limit).execute().data or []
+    return [
+        {'id': r['id'], 'title': r['title'], 'status': r['status'], 'assigned_to': r['assigned_to'], 'due_ts': _due_ts(r['due_date'])}
+        for r in rows
+    ]
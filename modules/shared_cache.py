@@ -0,0 +1,123 @@
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# sqlite backed cache shared by every worker process on the host: webhook dedup,
+# scheduler leases, short-lived query results, metrics totals and llm admission state
+
+CACHE_PATH = os.getenv("SHARED_CACHE_PATH", os.path.join(tempfile.gettempdir(), "task_app_cache.sqlite3"))
+
+class SharedCache:
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._local = threading.local()
+        self._init_schema()
+
+    def _conn(self):
+        # sqlite connections can't cross threads or forks, keep one per thread per process
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT, expires_at REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS metrics (metric TEXT, labels TEXT, value REAL, PRIMARY KEY (metric, labels))")
+
+    def _maybe_purge(self, now):
+        if random.random() < 0.01:
+            self._conn().execute("DELETE FROM kv WHERE expires_at < ?", (now,))
+
+    def get(self, key, default=None):
+        row = self._conn().execute("SELECT value FROM kv WHERE key = ? AND expires_at >= ?", (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (key, json.dumps(value, default=str), now + ttl))
+        self._maybe_purge(now)
+
+    def add(self, key, value, ttl):
+        """Stores the key only if it is absent or expired. True when this call stored it."""
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+            "WHERE kv.expires_at < ?",
+            (key, json.dumps(value, default=str), now + ttl, now))
+        self._maybe_purge(now)
+        return cur.rowcount == 1
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def cached(self, key, ttl, loader):
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.set(key, value, ttl)
+        return value
+
+    def acquire_lease(self, name, ttl, owner=None):
+        """True if the lease was free (or expired) and this owner now holds it for ttl seconds."""
+        owner = owner or self.owner
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE leases.expires_at < ?",
+            (name, owner, now + ttl, now))
+        return cur.rowcount == 1
+
+    def release_lease(self, name, owner=None):
+        self._conn().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner or self.owner))
+
+    def add_metrics(self, deltas):
+        """Adds {(metric, labels): delta} onto the host-wide totals."""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO metrics (metric, labels, value) VALUES (?, ?, ?) "
+                "ON CONFLICT(metric, labels) DO UPDATE SET value = value + excluded.value",
+                [(metric, labels, value) for (metric, labels), value in deltas.items()])
+
+    def read_metrics(self):
+        return {(m, l): v for m, l, v in self._conn().execute("SELECT metric, labels, value FROM metrics")}
+
+    @contextmanager
+    def locked(self):
+        """Runs the block as one write transaction, serialised across every process on the host."""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            yield
+
+_cache = None
+_cache_pid = None
+
+def get_shared_cache():
+    global _cache, _cache_pid
+    if _cache is None or _cache_pid != os.getpid():
+        _cache = SharedCache()
+        _cache_pid = os.getpid()
+    return _cache
@@ -1,36 +1,86 @@
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-def get_ist_now():
-    ist = timezone(timedelta(hours=5, minutes=30))
-    return datetime.now(ist)
+IST = timezone(timedelta(hours=5, minutes=30), "IST")
+DISPLAY_FORMAT = "%d/%m/%Y %H:%M"
 
-def format_datetime_ist(dt_str):
+@lru_cache(maxsize=64)
+def get_tz(name=None):
+    # users without a timezone (or with a bad one) fall back to IST
+    if not name:
+        return IST
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return IST
+
+def user_tz(user):
+    return get_tz((user or {}).get('timezone'))
+
+def tz_label(tz=None):
+    tz = tz or IST
+    return getattr(tz, 'key', None) or tz.tzname(None)
+
+def get_ist_now(tz=None):
+    return datetime.now(tz or IST)
+
+@lru_cache(maxsize=8192)
+def parse_iso(dt_str):
+    # timestamps repeat a lot across reruns, so parsing is memoized. naive values are taken as IST
     if not dt_str:
-        return "No due date"
+        return None
     try:
         dt = datetime.fromisoformat(dt_str)
-        ist = timezone(timedelta(hours=5, minutes=30))
-        dt_ist = dt.astimezone(ist)
-        return dt_ist.strftime("%d/%m/%Y %H:%M")
-    except:
+    except (TypeError, ValueError):
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=IST)
+
+@lru_cache(maxsize=8192)
+def _format(dt_str, tz):
+    dt = parse_iso(dt_str)
+    if dt is None:
         return dt_str
+    return dt.astimezone(tz).strftime(DISPLAY_FORMAT)
+
+def format_datetime_ist(dt_str, tz=None):
+    if not dt_str:
+        return "No due date"
+    return _format(dt_str, tz or IST)
 
-def to_ist_timestamp(date, time):
-    ist = timezone(timedelta(hours=5, minutes=30))
-    dt = datetime.combine(date, time)
-    dt_ist = ist.localize(dt) if hasattr(ist, 'localize') else dt.replace(tzinfo=ist)
-    return dt_ist.isoformat()
+def format_datetimes(values, tz=None):
+    """Batch format for a list or pandas Series of ISO strings."""
+    tz = tz or IST
+    fmt = lambda v: _format(v, tz) if isinstance(v, str) and v else "No due date"
+    if hasattr(values, 'map'):
+        return values.map(fmt)
+    return [fmt(v) for v in values]
 
-def get_hours_until_due(due_date_str):
-    if not due_date_str:
+def to_ist_timestamp(date, time, tz=None):
+    dt = datetime.combine(date, time).replace(tzinfo=tz or IST)
+    return dt.isoformat()
+
+def get_hours_until_due(due_date_str, now=None):
+    due = parse_iso(due_date_str)
+    if due is None:
         return None
-    try:
-        due = datetime.fromisoformat(due_date_str)
-        now = get_ist_now()
-        diff = due - now
-        return diff.total_seconds() / 3600
-    except:
+    return (due - (now or get_ist_now())).total_seconds() / 3600
+
+def hours_until_due_many(values, now=None):
+    """Batch variant of get_hours_until_due, every row is measured against the same now."""
+    now = now or get_ist_now()
+    return [get_hours_until_due(v, now) for v in values]
+
+def completed_on_time(due_date_str, completed_at_str):
+    """
+    On-time verdict for a completed task, None when it has no completed_at (completed before
+    the column existed). A task without a due date is on time, same as the workload counters.
+    """
+    completed = parse_iso(completed_at_str)
+    if completed is None:
         return None
+    due = parse_iso(due_date_str)
+    return due is None or completed <= due
 
 def is_within_24h(due_date_str):
     hours = get_hours_until_due(due_date_str)
@@ -0,0 +1,257 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from .database import with_optional_columns
+from .shared_cache import get_shared_cache
+from .utils import parse_iso
+
+logger = logging.getLogger(__name__)
+
+# per-employee workload counters for assignment suggestions. every task write moves the
+# counters by the difference between the task's old and new state, so reading an employee's
+# capacity is a primary key lookup and never a scan of their tasks. like the search index
+# the file is per host, sync_workload catches up on new ids and rebuilds periodically
+
+WORKLOAD_PATH = os.getenv("WORKLOAD_PATH", os.path.join(tempfile.gettempdir(), "task_app_workload.sqlite3"))
+WORKLOAD_COLUMNS = ['id', 'assigned_to', 'status', 'due_date', 'completed_at']
+DUE_SOON_DAYS = 3
+# open / due-soon task counts at which an employee counts as fully loaded
+TARGET_OPEN_TASKS = 10
+TARGET_DUE_SOON = 3
+BUILD_LEASE_TTL = 600
+SCHEMA_VERSION = 2
+TABLES = ('task_load', 'capacity', 'due_load')
+
+_local = threading.local()
+
+def _create_tables(conn, suffix=""):
+    # last known state of each task, needed to undo its old contribution on the next write
+    conn.execute(f"CREATE TABLE IF NOT EXISTS task_load{suffix} (task_id TEXT PRIMARY KEY, employee_id TEXT, "
+                 "open INTEGER, due_ts REAL, completed_ts REAL)")
+    # rated counts completions with a known completion time, only those have an on-time verdict
+    conn.execute(f"CREATE TABLE IF NOT EXISTS capacity{suffix} (employee_id TEXT PRIMARY KEY, open INTEGER DEFAULT 0, "
+                 "completed INTEGER DEFAULT 0, rated INTEGER DEFAULT 0, on_time INTEGER DEFAULT 0)")
+    conn.execute(f"CREATE TABLE IF NOT EXISTS due_load{suffix} (employee_id TEXT, due_day TEXT, open INTEGER DEFAULT 0, "
+                 "PRIMARY KEY (employee_id, due_day))")
+
+def _conn():
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid() or _local.path != WORKLOAD_PATH:
+        conn = sqlite3.connect(WORKLOAD_PATH, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            # counters from an older layout can't be migrated, drop them and let the sync rebuild
+            for table in TABLES + ('sync_state',):
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        _create_tables(conn)
+        conn.execute("CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, value TEXT)")
+        # tasks recorded while a rebuild runs, replayed into the new counters before the swap
+        conn.execute("CREATE TABLE IF NOT EXISTS build_log (task_id TEXT PRIMARY KEY)")
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.path = WORKLOAD_PATH
+    return conn
+
+def _key(value):
+    return json.dumps(value)
+
+def _day(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%d')
+
+def _ts(value):
+    parsed = parse_iso(value)
+    return parsed.timestamp() if parsed else None
+
+def _on_time(due_ts, completed_ts):
+    if completed_ts is None:
+        return None
+    return due_ts is None or completed_ts <= due_ts
+
+def _apply(conn, employee, open_, due_ts, completed_ts, sign, suffix=""):
+    conn.execute(f"INSERT OR IGNORE INTO capacity{suffix} (employee_id) VALUES (?)", (employee,))
+    if open_:
+        conn.execute(f"UPDATE capacity{suffix} SET open = open + ? WHERE employee_id = ?", (sign, employee))
+        if due_ts is not None:
+            due_day = _day(due_ts)
+            conn.execute(f"INSERT OR IGNORE INTO due_load{suffix} (employee_id, due_day) VALUES (?, ?)", (employee, due_day))
+            conn.execute(f"UPDATE due_load{suffix} SET open = open + ? WHERE employee_id = ? AND due_day = ?",
+                         (sign, employee, due_day))
+            if sign < 0:
+                conn.execute(f"DELETE FROM due_load{suffix} WHERE employee_id = ? AND due_day = ? AND open <= 0",
+                             (employee, due_day))
+    else:
+        on_time = _on_time(due_ts, completed_ts)
+        conn.execute(f"UPDATE capacity{suffix} SET completed = completed + ?, rated = rated + ?, on_time = on_time + ? "
+                     "WHERE employee_id = ?", (sign, sign * (on_time is not None), sign * bool(on_time), employee))
+
+def _record(conn, task, suffix=""):
+    key = _key(task['id'])
+    old = conn.execute(f"SELECT employee_id, open, due_ts, completed_ts FROM task_load{suffix} WHERE task_id = ?",
+                       (key,)).fetchone()
+    if old is None and not {'assigned_to', 'status'} <= task.keys():
+        # a partial update for a task we have never seen, the next sync picks it up
+        return
+    employee = _key(task['assigned_to']) if 'assigned_to' in task else old[0]
+    open_ = int(task['status'] != 'completed') if 'status' in task else old[1]
+    due_ts = _ts(task['due_date']) if 'due_date' in task else old[2]
+    if open_:
+        completed_ts = None
+    elif 'completed_at' in task:
+        completed_ts = _ts(task['completed_at'])
+    else:
+        completed_ts = old[3] if old else None
+    _set_state(conn, key, old, (employee, open_, due_ts, completed_ts), suffix)
+
+def _set_state(conn, key, old, new, suffix=""):
+    # new and old are (employee_id, open, due_ts, completed_ts) as stored in task_load
+    if old:
+        _apply(conn, *old, sign=-1, suffix=suffix)
+    conn.execute(f"INSERT INTO task_load{suffix} (task_id, employee_id, open, due_ts, completed_ts) VALUES (?, ?, ?, ?, ?) "
+                 "ON CONFLICT(task_id) DO UPDATE SET employee_id = excluded.employee_id, open = excluded.open, "
+                 "due_ts = excluded.due_ts, completed_ts = excluded.completed_ts", (key,) + tuple(new))
+    _apply(conn, *new, sign=1, suffix=suffix)
+
+def _replay_build_log(conn):
+    # the live counters already hold every task recorded during the build, at a state that
+    # may be newer than the page the build read it from
+    for (key,) in conn.execute("SELECT task_id FROM build_log").fetchall():
+        live = conn.execute("SELECT employee_id, open, due_ts, completed_ts FROM task_load WHERE task_id = ?", (key,)).fetchone()
+        if live:
+            old = conn.execute("SELECT employee_id, open, due_ts, completed_ts FROM task_load_build WHERE task_id = ?",
+                               (key,)).fetchone()
+            _set_state(conn, key, old, live, "_build")
+    conn.execute("DELETE FROM build_log")
+
+def _watermark(conn):
+    row = conn.execute("SELECT value FROM sync_state WHERE name = 'last_id'").fetchone()
+    return json.loads(row[0]) if row else None
+
+def _set_watermark(conn, last_id):
+    conn.execute("INSERT INTO sync_state (name, value) VALUES ('last_id', ?) "
+                 "ON CONFLICT(name) DO UPDATE SET value = excluded.value", (json.dumps(last_id),))
+
+def record_task(task):
+    """
+    Moves the counters to the task's new state. Needs id, plus any of assigned_to, status,
+    due_date and completed_at; fields left out keep their last recorded value.
+    """
+    conn = _conn()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        _record(conn, task)
+        if conn.execute("SELECT 1 FROM sync_state WHERE name = 'building'").fetchone():
+            conn.execute("INSERT OR IGNORE INTO build_log (task_id) VALUES (?)", (_key(task['id']),))
+
+def _iter_task_pages(supabase, after_id=None):
+    from .export import iter_optional_pages
+
+    # completed_at comes from a migration, without it completions are counted but not rated
+    return iter_optional_pages(supabase, 'tasks', WORKLOAD_COLUMNS, after_id=after_id)
+
+def rebuild_workload(supabase):
+    """Builds fresh counters next to the live ones and swaps them in, keeping tasks recorded meanwhile."""
+    conn = _conn()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for table in TABLES:
+            conn.execute(f"DROP TABLE IF EXISTS {table}_build")
+        _create_tables(conn, "_build")
+        conn.execute("DELETE FROM build_log")
+        conn.execute("INSERT OR REPLACE INTO sync_state (name, value) VALUES ('building', '1')")
+    count, last_id = 0, None
+    for page in _iter_task_pages(supabase):
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for task in page:
+                _record(conn, task, "_build")
+        count += len(page)
+        last_id = page[-1]['id']
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        _replay_build_log(conn)
+        conn.execute("DELETE FROM sync_state WHERE name = 'building'")
+        for table in TABLES:
+            conn.execute(f"DROP TABLE {table}")
+            conn.execute(f"ALTER TABLE {table}_build RENAME TO {table}")
+        _set_watermark(conn, last_id)
+    logger.info(f"Workload counters rebuilt from {count} tasks")
+    return count
+
+def catch_up(supabase):
+    """Counts tasks created since the last sync by any process or host."""
+    conn = _conn()
+    count = 0
+    for page in _iter_task_pages(supabase, after_id=_watermark(conn)):
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for task in page:
+                _record(conn, task)
+            _set_watermark(conn, page[-1]['id'])
+        count += len(page)
+    return count
+
+def workload_ready():
+    return _conn().execute("SELECT 1 FROM sync_state WHERE name = 'last_id'").fetchone() is not None
+
+def sync_workload(supabase, rebuild_interval):
+    """Same schedule as search.sync_index: catch-up on new ids, full rebuild every rebuild_interval."""
+    cache = get_shared_cache()
+    rebuild_due = cache.acquire_lease('workload_rebuild', rebuild_interval)
+    if workload_ready() and not rebuild_due:
+        return catch_up(supabase)
+    if not cache.acquire_lease('workload_build', BUILD_LEASE_TTL):
+        return 0
+    try:
+        return rebuild_workload(supabase)
+    finally:
+        cache.release_lease('workload_build')
+
+def capacity_score(open_tasks, due_soon, rated, on_time):
+    """0..1, higher means more room for another task. Reliability is smoothed so new hires start at 0.5."""
+    reliability = (on_time + 1) / (rated + 2)
+    return round(reliability / (1 + open_tasks / TARGET_OPEN_TASKS + due_soon / TARGET_DUE_SOON), 3)
+
+def get_capacity(employee_ids, now=None):
+    """Returns {employee_id: {open, due_soon, completed, rated, on_time, score}} for every id asked for."""
+    employee_ids = [e for e in employee_ids if e is not None]
+    if not employee_ids:
+        return {}
+    now = now or time.time()
+    first_day, last_day = _day(now), _day(now + DUE_SOON_DAYS * 86400)
+    marks = ','.join('?' * len(employee_ids))
+    keys = [_key(e) for e in employee_ids]
+    conn = _conn()
+    counts = {r[0]: r[1:] for r in conn.execute(
+        f"SELECT employee_id, open, completed, rated, on_time FROM capacity WHERE employee_id IN ({marks})", keys)}
+    due = dict(conn.execute(
+        f"SELECT employee_id, SUM(open) FROM due_load WHERE employee_id IN ({marks}) AND due_day BETWEEN ? AND ? "
+        f"GROUP BY employee_id", keys + [first_day, last_day]).fetchall())
+
+    result = {}
+    for emp_id, key in zip(employee_ids, keys):
+        open_tasks, completed, rated, on_time = counts.get(key, (0, 0, 0, 0))
+        due_soon = due.get(key) or 0
+        result[emp_id] = {
+            'open': open_tasks,
+            'due_soon': due_soon,
+            'completed': completed,
+            'rated': rated,
+            'on_time': on_time,
+            'score': capacity_score(open_tasks, due_soon, rated, on_time),
+        }
+    return result
+
+def suggest_assignees(employee_ids, limit=3, now=None):
+    """[(employee_id, capacity)] best first."""
+    ranked = sorted(get_capacity(employee_ids, now).items(), key=lambda item: -item[1]['score'])
+    return ranked[:limit] if limit else ranked
+
+def describe_capacity(cap):
+    return f"{cap['open']} open, {cap['due_soon']} due ≤{DUE_SOON_DAYS}d, capacity {cap['score']:.2f}"
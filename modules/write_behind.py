@@ -0,0 +1,151 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# write-behind queue for edits the ui has already applied optimistically. edits to the same
+# key are coalesced so only the latest value is written, and a failed write reports the last
+# confirmed value back so the ui can roll back to it
+
+WRITE_DELAY = float(os.getenv("WRITE_BEHIND_DELAY", "0.3"))
+WRITE_ATTEMPTS = int(os.getenv("WRITE_BEHIND_ATTEMPTS", "3"))
+
+class Entry:
+    QUEUED, SAVING, SAVED, FAILED = 'queued', 'saving', 'saved', 'failed'
+
+    def __init__(self, value, confirmed, write):
+        self.value = value
+        self.confirmed = confirmed
+        self.write = write
+        self.status = self.QUEUED
+        self.error = None
+        self.queued_at = time.monotonic()
+        self.dirty = True
+
+    @property
+    def pending(self):
+        return self.status in (self.QUEUED, self.SAVING)
+
+class WriteBehindQueue:
+    def __init__(self, delay=WRITE_DELAY, attempts=WRITE_ATTEMPTS):
+        self.delay = delay
+        self.attempts = attempts
+        self._entries = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._thread_pid = None
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive() or self._thread_pid != os.getpid():
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def submit(self, key, value, confirmed, write):
+        """
+        Queues write(value) for key, replacing any queued value for the same key.
+        confirmed is the value known to be stored; it is only taken from the first
+        submit since the last successful write.
+        """
+        with self._cond:
+            entry = self._entries.get(key)
+            if entry is None or not entry.pending:
+                # the first edit after a settled write starts from what that write stored
+                if entry is not None and entry.status == Entry.SAVED:
+                    confirmed = entry.value
+                entry = self._entries[key] = Entry(value, confirmed, write)
+            else:
+                entry.value = value
+                entry.write = write
+                entry.dirty = True
+                if entry.status == Entry.QUEUED:
+                    entry.queued_at = time.monotonic()
+            self._ensure_worker()
+            self._cond.notify()
+        return entry
+
+    def get(self, key):
+        with self._cond:
+            return self._entries.get(key)
+
+    def pending_count(self, keys=None):
+        with self._cond:
+            return sum(1 for k, e in self._entries.items() if e.pending and (keys is None or k in keys))
+
+    def acknowledge(self, key):
+        """Forgets a settled entry once the ui has shown its outcome."""
+        with self._cond:
+            entry = self._entries.get(key)
+            if entry is not None and not entry.pending:
+                del self._entries[key]
+
+    def flush(self, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while any(e.pending for e in self._entries.values()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _next_due(self):
+        # oldest queued entry whose debounce window has passed, or how long until one has
+        now = time.monotonic()
+        wait = None
+        for key, entry in self._entries.items():
+            if entry.status != Entry.QUEUED:
+                continue
+            left = entry.queued_at + self.delay - now
+            if left <= 0:
+                return key, entry, 0
+            wait = left if wait is None else min(wait, left)
+        return None, None, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                key, entry, wait = self._next_due()
+                while key is None:
+                    self._cond.wait(wait)
+                    key, entry, wait = self._next_due()
+                entry.status = Entry.SAVING
+                entry.dirty = False
+                value, write = entry.value, entry.write
+
+            error = None
+            for attempt in range(self.attempts):
+                try:
+                    write(value)
+                    error = None
+                    break
+                except Exception as e:
+                    error = e
+                    time.sleep(0.2 * 2 ** attempt)
+
+            with self._cond:
+                if error is None:
+                    entry.confirmed = value
+                if entry.dirty:
+                    # edited again while this write was in flight, write the newer value next
+                    entry.status = Entry.QUEUED
+                elif error is None:
+                    entry.status = Entry.SAVED
+                else:
+                    logger.error(f"Write-behind for {key} failed after {self.attempts} attempts: {error}")
+                    entry.status = Entry.FAILED
+                    entry.error = error
+                    entry.value = entry.confirmed
+                self._cond.notify_all()
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_write_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = WriteBehindQueue()
+        return _queue